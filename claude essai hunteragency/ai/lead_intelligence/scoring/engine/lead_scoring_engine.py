@@ -5,8 +5,19 @@ Score automatique de 1-10 pour 400+ profils/jour
 
 import asyncio
 import json
+import re
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+
+# Constantes de scoring (construites une seule fois à l'import)
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+NON_PHONE_CHARS = re.compile(r'[^\d+]')
+
+BUSINESS_KEYWORDS = ('serious', 'professional', 'booking', 'available', 'rates', 'outcall', 'incall')
+MAJOR_CITIES = ('new york', 'los angeles', 'chicago', 'miami', 'san francisco', 'las vegas')
+PREMIUM_CITIES = ('new york', 'los angeles', 'miami')
+POSITIVE_INDICATORS = ('professional', 'serious', 'discreet', 'upscale', 'verified', 'elite')
+NEGATIVE_INDICATORS = ('cheap', 'quick', 'fast', 'low', 'discount')
 
 class LeadScoringEngine:
     def __init__(self):
@@ -66,6 +77,10 @@ class LeadScoringEngine:
             print(f"❌ Erreur scoring: {e}")
             return self._default_score_result(getattr(profile, 'id', 0))
     
+    async def score_profiles_batch(self, profiles) -> List[Dict[str, Any]]:
+        """📦 Scorer un lot de profils en parallèle (résultats dans le même ordre)"""
+        return await asyncio.gather(*(self.score_profile(profile) for profile in profiles))
+    
     def _algorithmic_scoring(self, profile) -> float:
         """🔢 SCORING ALGORITHMIQUE - Règles business"""
         score = 0.0
@@ -110,8 +125,8 @@ class LeadScoringEngine:
                     content_score += 0.3
                 
                 # Mots-clés business
-                business_keywords = ['serious', 'professional', 'booking', 'available', 'rates', 'outcall', 'incall']
-                keyword_count = sum(1 for kw in business_keywords if kw.lower() in description.lower())
+                desc_lower = description.lower()
+                keyword_count = sum(1 for kw in BUSINESS_KEYWORDS if kw in desc_lower)
                 content_score += min(keyword_count * 0.3, 1.5)
                 
                 score += min(content_score, 2.5)
@@ -119,8 +134,8 @@ class LeadScoringEngine:
             # Geographic Factor (10% du score)
             location = getattr(profile, 'location', '')
             if location:
-                major_cities = ['new york', 'los angeles', 'chicago', 'miami', 'san francisco', 'las vegas']
-                if any(city in location.lower() for city in major_cities):
+                location_lower = location.lower()
+                if any(city in location_lower for city in MAJOR_CITIES):
                     score += 1.0
                 else:
                     score += 0.5
@@ -145,11 +160,9 @@ class LeadScoringEngine:
             await asyncio.sleep(0.1)  # Simuler appel API
             
             # Analyse basique des mots-clés pour simulation
-            positive_indicators = ['professional', 'serious', 'discreet', 'upscale', 'verified', 'elite']
-            negative_indicators = ['cheap', 'quick', 'fast', 'low', 'discount']
-            
-            positive_count = sum(1 for word in positive_indicators if word in description.lower())
-            negative_count = sum(1 for word in negative_indicators if word in description.lower())
+            desc_lower = description.lower()
+            positive_count = sum(1 for word in POSITIVE_INDICATORS if word in desc_lower)
+            negative_count = sum(1 for word in NEGATIVE_INDICATORS if word in desc_lower)
             
             # Score basé sur l'analyse
             base_score = 5.0
@@ -202,8 +215,8 @@ class LeadScoringEngine:
         if getattr(profile, 'onlyfans_url', None):
             estimated_value *= 1.8  # OnlyFans = plus de potentiel
         
-        location = getattr(profile, 'location', '')
-        if location and any(city in location.lower() for city in ['new york', 'los angeles', 'miami']):
+        location = (getattr(profile, 'location', '') or '').lower()
+        if location and any(city in location for city in PREMIUM_CITIES):
             estimated_value *= 1.4  # Grandes villes = plus de budget
         
         return {
@@ -231,14 +244,11 @@ class LeadScoringEngine:
     
     def _is_valid_email(self, email: str) -> bool:
         """Validation basique d'email"""
-        import re
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return bool(re.match(pattern, email))
+        return bool(EMAIL_PATTERN.match(email))
     
     def _is_valid_phone(self, phone: str) -> bool:
         """Validation basique de téléphone"""
-        import re
-        clean_phone = re.sub(r'[^\d+]', '', phone)
+        clean_phone = NON_PHONE_CHARS.sub('', phone)
         return len(clean_phone) >= 10
     
     def _default_score_result(self, profile_id: int) -> Dict[str, Any]:
@@ -67,23 +67,23 @@ async def test_scoring_engine():
     
     print(f"🔍 Test avec {len(test_profiles)} profils de test...\n")
     
-    for i, profile_data in enumerate(test_profiles, 1):
-        # Créer un objet profil mock
-        class MockProfile:
-            def __init__(self, data):
-                for key, value in data.items():
-                    setattr(self, key, value)
-        
-        profile = MockProfile(profile_data)
-        
+    # Créer des objets profil mock
+    class MockProfile:
+        def __init__(self, data):
+            for key, value in data.items():
+                setattr(self, key, value)
+    
+    profiles = [MockProfile(profile_data) for profile_data in test_profiles]
+    
+    # Scorer tout le lot en une fois
+    results = await engine.score_profiles_batch(profiles)
+    
+    for i, (profile, result) in enumerate(zip(profiles, results), 1):
         print(f"📊 TEST {i}/{len(test_profiles)} - Profil #{profile.id}")
         print(f"   Nom: {profile.name}")
         print(f"   Email: {profile.email}")
         print(f"   Description: {profile.description[:50]}...")
         
-        # Scorer le profil
-        result = await engine.score_profile(profile)
-        
         print(f"\n   🎯 RÉSULTATS:")
         print(f"   Score final: {result['final_score']}/10")
         print(f"   Classification: {result['classification']}")
@@ -4,18 +4,32 @@
 Enterprise-grade security with role-based access control
 """
 
+import asyncio
+import hashlib
+import hmac
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Any, Union, Optional, List
+from functools import lru_cache
+from typing import Annotated, Any, Union, Optional, List
+import bcrypt
+import redis.asyncio as aioredis
+from cachetools import TTLCache
 from passlib.context import CryptContext
-from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+import jwt
+from jwt import InvalidTokenError as JWTError
+from fastapi import BackgroundTasks, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, ForeignKey, event, select, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from pydantic import BaseModel, EmailStr
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from pydantic import AfterValidator, BaseModel
 from enum import Enum
 import logging
 
@@ -27,31 +41,89 @@ logger = logging.getLogger(__name__)
 
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
+_SECRET_KEY_BYTES = SECRET_KEY.encode("utf-8")  # encoded once, reused for every sign/verify
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (argon2 for new hashes, existing bcrypt hashes still verify)
+pwd_context = CryptContext(schemes=["argon2", "bcrypt"], default="argon2", deprecated=["bcrypt"])
+pwd_context.dummy_verify()  # load the hash backend now, not on the first login
+
+# Recent verify results, keyed by an HMAC so no password material is stored
+_verify_cache: TTLCache = TTLCache(maxsize=2048, ttl=60)
+_verify_cache_lock = threading.Lock()  # TTLCache expiry mutates on reads; the sync path runs in threads
+
+# Hashing/verification pool: the KDFs release the GIL, so threads run in parallel
+_pwd_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="pwd-hash")
+
+def _check_password(plain_password: str, hashed_password: str) -> bool:
+    """bcrypt hashes go straight to pyca/bcrypt, other schemes through passlib"""
+    if hashed_password.startswith("$2"):
+        return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+    return pwd_context.verify(plain_password, hashed_password)
+
+# Recently failed (email, password) pairs, keyed by an HMAC under the app secret;
+# a hit skips the KDF but still counts toward lockout
+_failed_login_cache: TTLCache = TTLCache(maxsize=10_000, ttl=5)
+
+# Account lockout
+MAX_LOGIN_ATTEMPTS = 5
+LOCKOUT_MINUTES = 30
+
+# Failed-login counters live in Redis when available, in-process otherwise
+REDIS_URL = os.getenv("REDIS_URL")
+_redis = aioredis.from_url(REDIS_URL) if REDIS_URL else None
+_local_login_failures: TTLCache = TTLCache(maxsize=10_000, ttl=LOCKOUT_MINUTES * 60)
 
 # Security scheme
 security = HTTPBearer()
 
+# Decoded token cache (bearer tokens are reused across many requests),
+# keyed by a digest so raw tokens are never held in memory
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", "30"))
+_token_cache: TTLCache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL_SECONDS)
+_token_cache_lock = threading.Lock()
+
 Base = declarative_base()
+
+# Database engine (shared pool, created once per process)
+DATABASE_URL = "sqlite+aiosqlite:///./hunter_agency.db"
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"timeout": 30},
+    poolclass=AsyncAdaptedQueuePool,  # aiosqlite file databases default to NullPool
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True
+)
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL + NORMAL sync: readers don't block the writer, fsync only at checkpoints"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
+async def migrate_schema(bind: Optional[AsyncEngine] = None) -> None:
+    """Bring an existing users table up to date (no-op on fresh or current databases)"""
+    async with (bind or engine).begin() as conn:
+        result = await conn.execute(text("PRAGMA table_info(users)"))
+        columns = {row[1] for row in result}
+        if columns and "token_version" not in columns:
+            await conn.execute(
+                text("ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0")
+            )
+            logger.info("Added users.token_version column")
+
 # Database dependency
-def get_db():
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
-    
-    DATABASE_URL = "sqlite:///./hunter_agency.db"
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def get_db():
+    async with AsyncSessionLocal() as session:
+        yield session
 # ============================================================================
 # 🏷️ USER ROLES & PERMISSIONS
 # ============================================================================
@@ -104,6 +176,15 @@ ROLE_PERMISSIONS = {
     ]
 }
 
+# Permission values per role, resolved once at import
+ROLE_PERMISSION_STRINGS = {
+    role.value: [p.value for p in perms] for role, perms in ROLE_PERMISSIONS.items()
+}
+_ROLE_PERMS_STR: dict[str, frozenset[str]] = {
+    role: frozenset(perms) for role, perms in ROLE_PERMISSION_STRINGS.items()
+}
+_SUPER = UserRole.SUPER_ADMIN.value
+
 # ============================================================================
 # 📊 DATABASE MODELS
 # ============================================================================
@@ -138,6 +219,7 @@ class User(Base):
     last_login = Column(DateTime)
     login_attempts = Column(Integer, default=0)
     locked_until = Column(DateTime)
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)  # bump to revoke issued tokens
     
     # Metadata
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -145,7 +227,7 @@ class User(Base):
     
     # Relationships
     organization = relationship("Organization", back_populates="users")
-    team = relationship("Team", back_populates="members")
+    team = relationship("Team", back_populates="members", foreign_keys=[team_id])
     refresh_tokens = relationship("RefreshToken", back_populates="user")
 
 class Organization(Base):
@@ -179,7 +261,7 @@ class Team(Base):
     
     # Relationships
     organization = relationship("Organization", back_populates="teams")
-    members = relationship("User", back_populates="team")
+    members = relationship("User", back_populates="team", foreign_keys="User.team_id")
 
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
@@ -204,8 +286,19 @@ class RefreshToken(Base):
 # 🔄 PYDANTIC SCHEMAS
 # ============================================================================
 
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+@lru_cache(maxsize=65536)
+def _cached_email_check(value: str) -> str:
+    """Shape-check an email address (results memoized per process)"""
+    if not _EMAIL_RE.fullmatch(value):
+        raise ValueError("value is not a valid email address")
+    return value
+
+ValidatedEmail = Annotated[str, AfterValidator(_cached_email_check)]
+
 class UserBase(BaseModel):
-    email: EmailStr
+    email: ValidatedEmail
     first_name: str
     last_name: str
     role: UserRole = UserRole.SALES_REP
@@ -236,7 +329,7 @@ class UserResponse(UserBase):
         from_attributes = True
 
 class UserLogin(BaseModel):
-    email: EmailStr
+    email: ValidatedEmail
     password: str
 
 class Token(BaseModel):
@@ -252,18 +345,83 @@ class TokenData(BaseModel):
     organization_id: Optional[int] = None
     team_id: Optional[int] = None
     permissions: List[str] = []
+    token_version: int = 0
 
 # ============================================================================
 # 🔐 AUTHENTICATION UTILITIES
 # ============================================================================
 
+async def _record_login_failure(email: str) -> int:
+    """Increment the failed-login counter for an email, return the new count"""
+    key = f"login_fail:{email}"
+    if _redis is not None:
+        async with _redis.pipeline(transaction=True) as pipe:
+            attempts, _ = await pipe.incr(key).expire(key, LOCKOUT_MINUTES * 60).execute()
+        return attempts
+    
+    attempts = _local_login_failures.get(key, 0) + 1
+    _local_login_failures[key] = attempts
+    return attempts
+
+async def _clear_login_failures(email: str) -> None:
+    """Reset the failed-login counter for an email"""
+    key = f"login_fail:{email}"
+    if _redis is not None:
+        await _redis.delete(key)
+    else:
+        _local_login_failures.pop(key, None)
+
+async def _flush_login_success(user_id: int, logged_in_at: datetime) -> None:
+    """Persist a successful login in its own session"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(login_attempts=0, locked_until=None, last_login=logged_in_at)
+        )
+        await session.commit()
+
 class AuthManager:
     """Handles authentication and authorization logic"""
     
+    @staticmethod
+    def _verify_cache_key(plain_password: str, hashed_password: str) -> bytes:
+        return hmac.new(
+            _SECRET_KEY_BYTES,
+            plain_password.encode() + b"\0" + hashed_password.encode(),
+            hashlib.sha256
+        ).digest()
+    
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
-        return pwd_context.verify(plain_password, hashed_password)
+        cache_key = AuthManager._verify_cache_key(plain_password, hashed_password)
+        with _verify_cache_lock:
+            cached = _verify_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        verified = _check_password(plain_password, hashed_password)
+        with _verify_cache_lock:
+            _verify_cache[cache_key] = verified
+        return verified
+    
+    @staticmethod
+    async def averify_password(plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against its hash off the event loop"""
+        cache_key = AuthManager._verify_cache_key(plain_password, hashed_password)
+        with _verify_cache_lock:
+            cached = _verify_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        loop = asyncio.get_running_loop()
+        verified = await loop.run_in_executor(
+            _pwd_pool, _check_password, plain_password, hashed_password
+        )
+        with _verify_cache_lock:
+            _verify_cache[cache_key] = verified
+        return verified
     
     @staticmethod
     def get_password_hash(password: str) -> str:
@@ -271,17 +429,33 @@ class AuthManager:
         return pwd_context.hash(password)
     
     @staticmethod
-    def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-        """Create JWT access token"""
+    async def aget_password_hash(password: str) -> str:
+        """Hash a password off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_pwd_pool, pwd_context.hash, password)
+    
+    @staticmethod
+    def create_access_token(
+        data: dict,
+        expires_delta: Optional[timedelta] = None,
+        *,
+        token_version: int
+    ):
+        """Create JWT access token
+        
+        token_version must be the user's current User.token_version: get_current_user
+        rejects any token whose ver does not match it.
+        """
         to_encode = data.copy()
         
+        # exp is a NumericDate (seconds since epoch)
         if expires_delta:
-            expire = datetime.utcnow() + expires_delta
+            expire = int(time.time() + expires_delta.total_seconds())
         else:
-            expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+            expire = int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
         
-        to_encode.update({"exp": expire, "type": "access"})
-        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        to_encode.update({"exp": expire, "type": "access", "ver": token_version})
+        encoded_jwt = jwt.encode(to_encode, _SECRET_KEY_BYTES, algorithm=ALGORITHM)
         
         return encoded_jwt
     
@@ -289,16 +463,26 @@ class AuthManager:
     def create_refresh_token(data: dict) -> str:
         """Create JWT refresh token"""
         to_encode = data.copy()
-        expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        expire = int(time.time()) + REFRESH_TOKEN_EXPIRE_DAYS * 86400
         to_encode.update({"exp": expire, "type": "refresh"})
         
-        return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        return jwt.encode(to_encode, _SECRET_KEY_BYTES, algorithm=ALGORITHM)
     
     @staticmethod
     def verify_token(token: str) -> Optional[TokenData]:
-        """Verify and decode JWT token"""
+        """Verify and decode JWT token (successful decodes are cached until exp)"""
+        cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        with _token_cache_lock:
+            cached = _token_cache.get(cache_key)
+        if cached is not None:
+            token_data, exp = cached
+            if exp is None or exp > time.time():
+                return token_data
+            with _token_cache_lock:
+                _token_cache.pop(cache_key, None)
+        
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            payload = jwt.decode(token, _SECRET_KEY_BYTES, algorithms=[ALGORITHM])
             user_id: int = payload.get("sub")
             email: str = payload.get("email")
             role: str = payload.get("role")
@@ -308,26 +492,53 @@ class AuthManager:
             if user_id is None or email is None:
                 return None
                 
-            # Get permissions for role
-            permissions = ROLE_PERMISSIONS.get(UserRole(role), [])
-            permission_strings = [p.value for p in permissions]
-            
-            return TokenData(
+            token_data = TokenData(
                 user_id=user_id,
                 email=email,
                 role=role,
                 organization_id=organization_id,
                 team_id=team_id,
-                permissions=permission_strings
+                permissions=ROLE_PERMISSION_STRINGS.get(role, []),
+                token_version=payload.get("ver", 0)
             )
+            with _token_cache_lock:
+                _token_cache[cache_key] = (token_data, payload.get("exp"))
+            
+            return token_data
             
         except JWTError:
             return None
     
     @staticmethod
-    def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-        """Authenticate user with email and password"""
-        user = db.query(User).filter(User.email == email).first()
+    async def revoke_tokens(db: AsyncSession, user_id: int) -> None:
+        """Invalidate every access token issued to a user"""
+        await db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(token_version=User.token_version + 1)
+        )
+        await db.commit()
+    
+    @staticmethod
+    async def authenticate_user(
+        db: AsyncSession,
+        email: str,
+        password: str,
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> Optional[User]:
+        """Authenticate user with email and password
+        
+        When background_tasks is given, the last_login write runs after the response.
+        """
+        failed_key = hmac.new(
+            _SECRET_KEY_BYTES,
+            email.encode() + b"\0" + password.encode(),
+            hashlib.sha256
+        ).digest()
+        known_failure = failed_key in _failed_login_cache
+        
+        result = await db.execute(select(User).where(User.email == email))
+        user = result.scalar_one_or_none()
         
         if not user:
             return None
@@ -335,23 +546,28 @@ class AuthManager:
         if not user.is_active:
             return None
             
+        now = datetime.utcnow()
+        
         # Check if account is locked
-        if user.locked_until and user.locked_until > datetime.utcnow():
+        if user.locked_until and user.locked_until > now:
             return None
             
-        if not AuthManager.verify_password(password, user.hashed_password):
-            # Increment login attempts
-            user.login_attempts += 1
-            if user.login_attempts >= 5:
-                user.locked_until = datetime.utcnow() + timedelta(minutes=30)
-            db.commit()
+        if known_failure or not await AuthManager.averify_password(password, user.hashed_password):
+            _failed_login_cache[failed_key] = True
+            # Count the failure outside SQL, only write once the account locks
+            attempts = await _record_login_failure(email)
+            if attempts >= MAX_LOGIN_ATTEMPTS:
+                user.login_attempts = attempts
+                user.locked_until = now + timedelta(minutes=LOCKOUT_MINUTES)
+                await db.commit()
             return None
         
         # Reset login attempts on successful login
-        user.login_attempts = 0
-        user.locked_until = None
-        user.last_login = datetime.utcnow()
-        db.commit()
+        await _clear_login_failures(email)
+        if background_tasks is not None:
+            background_tasks.add_task(_flush_login_success, user.id, now)
+        else:
+            await _flush_login_success(user.id, now)
         
         return user
 
@@ -359,11 +575,33 @@ class AuthManager:
 # 🛡️ AUTHORIZATION DECORATORS & DEPENDENCIES
 # ============================================================================
 
+@dataclass(slots=True)
+class AuthedUser:
+    """Columns of the authenticated user needed by auth dependencies
+    
+    get_current_user and the permission/role dependencies return this read-only snapshot,
+    not the ORM User: it is not attached to any session and only carries the fields below
+    (the ones DataFilter and the endpoints use). Routes needing other columns or an ORM
+    instance to modify must load the User by id themselves.
+    """
+    id: int
+    email: str
+    role: str
+    organization_id: Optional[int]
+    team_id: Optional[int]
+    is_active: bool
+    token_version: int
+
+_AUTHED_USER_COLUMNS = (
+    User.id, User.email, User.role, User.organization_id, User.team_id, User.is_active,
+    User.token_version
+)
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current authenticated user"""
+    db: AsyncSession = Depends(get_db)
+) -> AuthedUser:
+    """Get current authenticated user (as an AuthedUser snapshot, not an ORM User)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -378,8 +616,16 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == token_data.user_id).first()
-    if user is None:
+    result = await db.execute(
+        select(*_AUTHED_USER_COLUMNS).where(User.id == token_data.user_id)
+    )
+    row = result.one_or_none()
+    if row is None:
+        raise credentials_exception
+    user = AuthedUser(*row)
+    
+    # Revocation check rides on the user lookup, no extra query
+    if (user.token_version or 0) != token_data.token_version:
         raise credentials_exception
         
     if not user.is_active:
@@ -390,7 +636,7 @@ async def get_current_user(
     
     return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: AuthedUser = Depends(get_current_user)) -> AuthedUser:
     """Get current active user"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -398,10 +644,9 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
 
 def require_permission(permission: Permission):
     """Decorator to require specific permission"""
-    def permission_checker(current_user: User = Depends(get_current_active_user)):
-        user_permissions = ROLE_PERMISSIONS.get(UserRole(current_user.role), [])
-        
-        if permission not in user_permissions and UserRole(current_user.role) != UserRole.SUPER_ADMIN:
+    async def permission_checker(current_user: AuthedUser = Depends(get_current_active_user)):
+        if (permission.value not in _ROLE_PERMS_STR.get(current_user.role, frozenset())
+                and current_user.role != _SUPER):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Not enough permissions. Required: {permission.value}"
@@ -412,8 +657,8 @@ def require_permission(permission: Permission):
 
 def require_role(role: UserRole):
     """Decorator to require specific role"""
-    def role_checker(current_user: User = Depends(get_current_active_user)):
-        if UserRole(current_user.role) != role and UserRole(current_user.role) != UserRole.SUPER_ADMIN:
+    async def role_checker(current_user: AuthedUser = Depends(get_current_active_user)):
+        if current_user.role != role.value and current_user.role != _SUPER:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Access denied. Required role: {role.value}"
@@ -426,70 +671,57 @@ def require_role(role: UserRole):
 # 🔒 DATA ISOLATION FILTERS
 # ============================================================================
 
+def _assigned_leads(query, user):
+    return query.filter(Lead.assigned_to == user.email)
+
+def _is_assigned(lead, user) -> bool:
+    return lead.assigned_to == user.email
+
+# Role -> query filter (super admin sees everything, admin their organization,
+# sales manager their team, everyone else only their assigned leads)
+_FILTER_BY_ROLE = {
+    UserRole.SUPER_ADMIN.value: lambda query, user: query,
+    UserRole.ADMIN.value: lambda query, user: query.filter(Lead.organization_id == user.organization_id),
+    UserRole.SALES_MANAGER.value: lambda query, user: query.filter(
+        or_(Lead.assigned_to == user.email, Lead.team_id == user.team_id)
+    ),
+    UserRole.SALES_REP.value: _assigned_leads,
+    UserRole.VIEWER.value: _assigned_leads,
+}
+
+# Role -> single-lead access predicate
+_ACCESS_BY_ROLE = {
+    UserRole.SUPER_ADMIN.value: lambda lead, user: True,
+    UserRole.ADMIN.value: lambda lead, user: (
+        lead.organization_id == user.organization_id or lead.assigned_to == user.email
+    ),
+    UserRole.SALES_MANAGER.value: lambda lead, user: (
+        lead.assigned_to == user.email or lead.team_id == user.team_id
+    ),
+    UserRole.SALES_REP.value: _is_assigned,
+    UserRole.VIEWER.value: _is_assigned,
+}
+
 class DataFilter:
     """Handles data isolation based on user role and organization"""
     
     @staticmethod
-    def filter_leads_query(query, user: User):
+    def filter_leads_query(query, user: AuthedUser):
         """Filter leads based on user's access level"""
-        role = UserRole(user.role)
-        
-        if role == UserRole.SUPER_ADMIN:
-            # Super admin sees everything
-            return query
-        
-        elif role == UserRole.ADMIN:
-            # Admin sees all leads in their organization
-            return query.filter(Lead.organization_id == user.organization_id)
-        
-        elif role == UserRole.SALES_MANAGER:
-            # Sales manager sees leads from their team
-            return query.filter(
-                or_(
-                    Lead.assigned_to == user.email,
-                    Lead.team_id == user.team_id
-                )
-            )
-        
-        else:  # SALES_REP, VIEWER
-            # Sales rep sees only their assigned leads
-            return query.filter(Lead.assigned_to == user.email)
+        return _FILTER_BY_ROLE.get(user.role, _assigned_leads)(query, user)
     
     @staticmethod
-    def can_access_lead(lead, user: User) -> bool:
+    def can_access_lead(lead, user: AuthedUser) -> bool:
         """Check if user can access specific lead"""
-        role = UserRole(user.role)
-        
-        if role == UserRole.SUPER_ADMIN:
-            return True
-            
-        if role == UserRole.ADMIN and lead.organization_id == user.organization_id:
-            return True
-            
-        if role == UserRole.SALES_MANAGER and (
-            lead.assigned_to == user.email or lead.team_id == user.team_id
-        ):
-            return True
-            
-        if lead.assigned_to == user.email:
-            return True
-            
-        return False
+        return _ACCESS_BY_ROLE.get(user.role, _is_assigned)(lead, user)
     
     @staticmethod
-    def can_modify_lead(lead, user: User) -> bool:
+    def can_modify_lead(lead, user: AuthedUser) -> bool:
         """Check if user can modify specific lead"""
-        if not DataFilter.can_access_lead(lead, user):
+        # Viewers can't modify, others can if they can access
+        if user.role == UserRole.VIEWER.value:
             return False
-            
-        role = UserRole(user.role)
-        
-        # Viewers can't modify
-        if role == UserRole.VIEWER:
-            return False
-            
-        # Others can modify if they can access
-        return True
+        return DataFilter.can_access_lead(lead, user)
 
 # ============================================================================
 # 🎯 EXAMPLE USAGE IN FASTAPI
@@ -505,8 +737,8 @@ def secure_endpoint_example():
     @app.post("/leads", dependencies=[Depends(require_permission(Permission.LEAD_CREATE))])
     async def create_lead(
         lead_data: dict,
-        current_user: User = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        current_user: AuthedUser = Depends(get_current_active_user),
+        db: AsyncSession = Depends(get_db)
     ):
         """Create lead with proper authorization"""
         # Lead will automatically be associated with user's org/team
@@ -519,27 +751,28 @@ def secure_endpoint_example():
     
     @app.get("/leads")
     async def get_leads(
-        current_user: User = Depends(require_permission(Permission.LEAD_READ)),
-        db: Session = Depends(get_db)
+        current_user: AuthedUser = Depends(require_permission(Permission.LEAD_READ)),
+        db: AsyncSession = Depends(get_db)
     ):
         """Get leads with data isolation"""
-        query = db.query(Lead)
+        query = select(Lead)
         
         # Apply data filter based on user role
         filtered_query = DataFilter.filter_leads_query(query, current_user)
         
-        leads = filtered_query.all()
-        return leads
+        result = await db.execute(filtered_query)
+        return result.scalars().all()
     
     @app.put("/leads/{lead_id}")
     async def update_lead(
         lead_id: int,
         lead_data: dict,
-        current_user: User = Depends(require_permission(Permission.LEAD_UPDATE)),
-        db: Session = Depends(get_db)
+        current_user: AuthedUser = Depends(require_permission(Permission.LEAD_UPDATE)),
+        db: AsyncSession = Depends(get_db)
     ):
         """Update lead with access control"""
-        lead = db.query(Lead).filter(Lead.id == lead_id).first()
+        result = await db.execute(select(Lead).where(Lead.id == lead_id))
+        lead = result.scalar_one_or_none()
         
         if not lead:
             raise HTTPException(status_code=404, detail="Lead not found")
@@ -559,6 +792,3 @@ if __name__ == "__main__":
     print("✅ Permission-based endpoints")
     print("✅ Account security (lockout, attempts)")
     print("🚀 Ready for production!")
-def get_db():
-    """Database dependency - placeholder"""
-    pass
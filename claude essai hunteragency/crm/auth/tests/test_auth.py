@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+🧪 HUNTER AGENCY - Auth Test Suite
+JWT authentication, password hashing and token revocation
+"""
+
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from fastapi import BackgroundTasks, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from crm.auth import (
+    MAX_LOGIN_ATTEMPTS, AuthedUser, AuthManager, Base, DataFilter, User, UserRole, get_current_user,
+    migrate_schema
+)
+
+# ============================================================================
+# 🔧 TEST CONFIGURATION
+# ============================================================================
+
+# Test database URL (in-memory SQLite, one connection shared by the whole test)
+TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+
+# ============================================================================
+# 🏗️ TEST FIXTURES
+# ============================================================================
+
+@pytest_asyncio.fixture
+async def test_engine():
+    """Create a fresh in-memory database engine"""
+    engine = create_async_engine(
+        TEST_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    yield engine
+    await engine.dispose()
+
+@pytest_asyncio.fixture
+async def db_session(test_engine):
+    """Create an async session on a database with the current schema"""
+    async with test_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    
+    session_factory = async_sessionmaker(test_engine, expire_on_commit=False)
+    async with session_factory() as session:
+        yield session
+
+def bearer(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+# ============================================================================
+# 🔐 AUTHENTICATION TESTS
+# ============================================================================
+
+class TestAuthManager:
+    """Test authentication manager"""
+    
+    def test_password_hashing(self):
+        """Test password hashing and verification"""
+        password = "test_password_123"
+        hashed = AuthManager.get_password_hash(password)
+        
+        assert hashed != password, "Password should be hashed"
+        assert AuthManager.verify_password(password, hashed), "Should verify correct password"
+        assert not AuthManager.verify_password("wrong_password", hashed), "Should reject wrong password"
+    
+    def test_create_access_token(self):
+        """Test access token creation"""
+        data = {
+            "sub": 1,
+            "email": "test@example.com",
+            "role": "sales_rep"
+        }
+        
+        token = AuthManager.create_access_token(data, token_version=0)
+        
+        assert isinstance(token, str), "Token should be string"
+        assert len(token) > 0, "Token should not be empty"
+    
+    def test_verify_token_valid(self):
+        """Test valid token verification"""
+        data = {
+            "sub": 1,
+            "email": "test@example.com",
+            "role": "sales_rep",
+            "organization_id": 1,
+            "team_id": 1
+        }
+        
+        token = AuthManager.create_access_token(data, token_version=0)
+        token_data = AuthManager.verify_token(token)
+        
+        assert token_data is not None
+        assert token_data.user_id == 1
+        assert token_data.email == "test@example.com"
+        assert token_data.role == "sales_rep"
+    
+    def test_create_access_token_requires_token_version(self):
+        """Test that forgetting token_version fails loudly"""
+        with pytest.raises(TypeError):
+            AuthManager.create_access_token({"sub": 1, "email": "test@example.com"})
+    
+    def test_verify_token_invalid(self):
+        """Test invalid token verification"""
+        invalid_token = "invalid.token.here"
+        token_data = AuthManager.verify_token(invalid_token)
+        
+        assert token_data is None
+    
+    @pytest.mark.asyncio
+    async def test_authenticate_user_success(self, db_session):
+        """Test successful user authentication"""
+        # Create user
+        password = "test_password"
+        hashed_password = AuthManager.get_password_hash(password)
+        
+        user = User(
+            email="test@example.com",
+            hashed_password=hashed_password,
+            first_name="Test",
+            last_name="User",
+            is_active=True
+        )
+        db_session.add(user)
+        await db_session.commit()
+        
+        # Authenticate (last_login flush deferred to the background task)
+        authenticated_user = await AuthManager.authenticate_user(
+            db_session, "test@example.com", password, background_tasks=BackgroundTasks()
+        )
+        
+        assert authenticated_user is not None
+        assert authenticated_user.email == "test@example.com"
+    
+    @pytest.mark.asyncio
+    async def test_authenticate_user_wrong_password(self, db_session):
+        """Test authentication with wrong password"""
+        # Create user
+        password = "test_password"
+        hashed_password = AuthManager.get_password_hash(password)
+        
+        user = User(
+            email="wrong-password@example.com",
+            hashed_password=hashed_password,
+            first_name="Test",
+            last_name="User",
+            is_active=True
+        )
+        db_session.add(user)
+        await db_session.commit()
+        
+        # Try wrong password
+        authenticated_user = await AuthManager.authenticate_user(
+            db_session, "wrong-password@example.com", "wrong_password", background_tasks=BackgroundTasks()
+        )
+        
+        assert authenticated_user is None
+    
+    @pytest.mark.asyncio
+    async def test_repeated_wrong_password_still_locks_account(self, db_session):
+        """Test that failures served from the failed-login cache still count toward lockout"""
+        user = User(
+            email="lockout@example.com",
+            hashed_password=AuthManager.get_password_hash("test_password"),
+            first_name="Test",
+            last_name="User",
+            is_active=True
+        )
+        db_session.add(user)
+        await db_session.commit()
+        
+        # Same wrong password every time: all but the first attempt hit the cache
+        for _ in range(MAX_LOGIN_ATTEMPTS):
+            assert await AuthManager.authenticate_user(
+                db_session, "lockout@example.com", "wrong_password", background_tasks=BackgroundTasks()
+            ) is None
+        
+        await db_session.refresh(user)
+        assert user.login_attempts == MAX_LOGIN_ATTEMPTS
+        assert user.locked_until is not None
+
+# ============================================================================
+# 🛡️ DEPENDENCY TESTS
+# ============================================================================
+
+class TestCurrentUser:
+    """Test the get_current_user dependency"""
+    
+    @pytest.mark.asyncio
+    async def test_current_user_snapshot_fields(self, db_session):
+        """Test that get_current_user returns an AuthedUser with the fields routes use"""
+        user = User(
+            email="rep@example.com",
+            hashed_password=AuthManager.get_password_hash("test_password"),
+            first_name="Test",
+            last_name="User",
+            role=UserRole.SALES_REP.value,
+            organization_id=7,
+            team_id=3,
+            is_active=True
+        )
+        db_session.add(user)
+        await db_session.commit()
+        
+        token = AuthManager.create_access_token(
+            {"sub": user.id, "email": user.email, "role": user.role},
+            token_version=user.token_version
+        )
+        current_user = await get_current_user(bearer(token), db_session)
+        
+        assert isinstance(current_user, AuthedUser)
+        assert (current_user.id, current_user.email, current_user.role) == (user.id, "rep@example.com", "sales_rep")
+        assert (current_user.organization_id, current_user.team_id) == (7, 3)
+        assert current_user.is_active
+        
+        # DataFilter works on the snapshot
+        own_lead = SimpleNamespace(assigned_to="rep@example.com", organization_id=7, team_id=3)
+        other_lead = SimpleNamespace(assigned_to="other@example.com", organization_id=7, team_id=3)
+        assert DataFilter.can_access_lead(own_lead, current_user)
+        assert DataFilter.can_modify_lead(own_lead, current_user)
+        assert not DataFilter.can_access_lead(other_lead, current_user)
+    
+    @pytest.mark.asyncio
+    async def test_revoke_then_relogin_token_accepted(self, db_session):
+        """Test that revocation rejects old tokens and a re-login token is accepted"""
+        password = "test_password"
+        user = User(
+            email="revoked@example.com",
+            hashed_password=AuthManager.get_password_hash(password),
+            first_name="Test",
+            last_name="User",
+            is_active=True
+        )
+        db_session.add(user)
+        await db_session.commit()
+        
+        claims = {"sub": user.id, "email": user.email, "role": user.role}
+        old_token = AuthManager.create_access_token(claims, token_version=user.token_version)
+        assert (await get_current_user(bearer(old_token), db_session)).id == user.id
+        
+        await AuthManager.revoke_tokens(db_session, user.id)
+        
+        with pytest.raises(HTTPException) as exc_info:
+            await get_current_user(bearer(old_token), db_session)
+        assert exc_info.value.status_code == 401
+        
+        # Re-login mints a token with the user's current version
+        logged_in = await AuthManager.authenticate_user(
+            db_session, "revoked@example.com", password, background_tasks=BackgroundTasks()
+        )
+        new_token = AuthManager.create_access_token(claims, token_version=logged_in.token_version)
+        current_user = await get_current_user(bearer(new_token), db_session)
+        
+        assert current_user.id == user.id
+        assert current_user.token_version == 1
+
+# ============================================================================
+# 🗄️ SCHEMA MIGRATION TESTS
+# ============================================================================
+
+class TestMigrateSchema:
+    """Test upgrading databases created before token_version existed"""
+    
+    @pytest.mark.asyncio
+    async def test_adds_token_version_to_existing_users_table(self, test_engine):
+        """Test that an old users table gets token_version and its users can authenticate"""
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(text("ALTER TABLE users DROP COLUMN token_version"))
+            await conn.execute(text(
+                "INSERT INTO users (email, hashed_password, first_name, last_name, role, is_active) "
+                "VALUES ('legacy@example.com', 'x', 'Legacy', 'User', 'sales_rep', 1)"
+            ))
+        
+        await migrate_schema(test_engine)
+        await migrate_schema(test_engine)  # idempotent
+        
+        async with test_engine.connect() as conn:
+            columns = {row[1] for row in await conn.execute(text("PRAGMA table_info(users)"))}
+            version = (await conn.execute(
+                text("SELECT token_version FROM users WHERE email = 'legacy@example.com'")
+            )).scalar_one()
+        assert "token_version" in columns
+        assert version == 0
+        
+        session_factory = async_sessionmaker(test_engine, expire_on_commit=False)
+        async with session_factory() as session:
+            token = AuthManager.create_access_token(
+                {"sub": 1, "email": "legacy@example.com", "role": "sales_rep"}, token_version=0
+            )
+            assert (await get_current_user(bearer(token), session)).email == "legacy@example.com"
+    
+    @pytest.mark.asyncio
+    async def test_no_users_table_is_a_noop(self, test_engine):
+        """Test that migrating a database without a users table does nothing"""
+        await migrate_schema(test_engine)
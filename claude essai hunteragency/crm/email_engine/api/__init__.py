@@ -7,12 +7,14 @@ FastAPI interface for email campaign management & automation
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Query, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse, FileResponse
+from sqlalchemy import and_, func, or_, select
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 import logging
 import asyncio
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, TypeAdapter
 
 # Import our models and services
 from .models import (
@@ -34,7 +36,14 @@ logger = logging.getLogger(__name__)
 # 🚀 FASTAPI APP SETUP
 # ============================================================================
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Close the pooled Loom client on shutdown"""
+    yield
+    await LOOM_SERVICE.aclose()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="📧 Hunter Agency - Email Engine",
     description="Advanced email automation with Loom integration & mass personalization",
     version="2.0.0",
@@ -57,6 +66,27 @@ def get_db():
     from unittest.mock import Mock
     return Mock()
 
+# Shared services (read-only after construction, built once per process)
+LOOM_SERVICE = LoomService()
+TEMPLATE_ENGINE = EmailTemplateEngine(LOOM_SERVICE)
+
+def _columns_for(model, response_model):
+    """ORM columns backing each field of a response schema"""
+    return [getattr(model, field) for field in response_model.model_fields]
+
+# Slug generation: spaces and dashes become underscores in a single pass
+SLUG_TRANSLATION = str.maketrans({' ': '_', '-': '_'})
+
+# List endpoints select plain columns instead of hydrating ORM entities
+TEMPLATE_LIST_COLUMNS = _columns_for(EmailTemplate, EmailTemplateResponse)
+SEQUENCE_LIST_COLUMNS = _columns_for(EmailSequence, EmailSequenceResponse)
+LOOM_VIDEO_LIST_COLUMNS = _columns_for(LoomVideo, LoomVideoResponse)
+
+# One validator per list response, built at import
+TEMPLATE_LIST_ADAPTER = TypeAdapter(List[EmailTemplateResponse])
+SEQUENCE_LIST_ADAPTER = TypeAdapter(List[EmailSequenceResponse])
+LOOM_VIDEO_LIST_ADAPTER = TypeAdapter(List[LoomVideoResponse])
+
 # ============================================================================
 # 📧 EMAIL TEMPLATE ENDPOINTS
 # ============================================================================
@@ -70,11 +100,10 @@ async def create_template(
     try:
         # Generate slug if not provided
         if not template.slug:
-            template.slug = template.name.lower().replace(' ', '_').replace('-', '_')
+            template.slug = template.name.lower().translate(SLUG_TRANSLATION)
         
         # Validate template syntax
-        template_engine = EmailTemplateEngine()
-        validation = template_engine.validate_template(template.html_template)
+        validation = TEMPLATE_ENGINE.validate_template(template.html_template)
         
         if not validation['valid']:
             raise HTTPException(
@@ -83,7 +112,7 @@ async def create_template(
             )
         
         # Create template
-        db_template = EmailTemplate(**template.dict())
+        db_template = EmailTemplate(**template.model_dump())
         db.add(db_template)
         db.commit()
         db.refresh(db_template)
@@ -107,23 +136,23 @@ async def get_templates(
 ):
     """Get email templates with filtering"""
     try:
-        query = db.query(EmailTemplate)
+        query = select(*TEMPLATE_LIST_COLUMNS)
         
         # Apply filters
         if active_only:
-            query = query.filter(EmailTemplate.is_active == True)
+            query = query.where(EmailTemplate.is_active == True)
         if category:
-            query = query.filter(EmailTemplate.category == category)
+            query = query.where(EmailTemplate.category == category)
         if search:
-            query = query.filter(
-                db.or_(
+            query = query.where(
+                or_(
                     EmailTemplate.name.ilike(f"%{search}%"),
                     EmailTemplate.subject_template.ilike(f"%{search}%")
                 )
             )
         
-        templates = query.offset(skip).limit(limit).all()
-        return [EmailTemplateResponse.from_orm(t) for t in templates]
+        rows = db.execute(query.offset(skip).limit(limit)).all()
+        return TEMPLATE_LIST_ADAPTER.validate_python(rows, from_attributes=True)
         
     except Exception as e:
         logger.error(f"❌ Failed to get templates: {str(e)}")
@@ -151,8 +180,7 @@ async def update_template(
     
     # Validate template if HTML is being updated
     if template_update.html_template:
-        template_engine = EmailTemplateEngine()
-        validation = template_engine.validate_template(template_update.html_template)
+        validation = TEMPLATE_ENGINE.validate_template(template_update.html_template)
         
         if not validation['valid']:
             raise HTTPException(
@@ -161,7 +189,7 @@ async def update_template(
             )
     
     # Update fields
-    update_data = template_update.dict(exclude_unset=True)
+    update_data = template_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_template, field, value)
     
@@ -183,9 +211,7 @@ async def preview_template(
         raise HTTPException(status_code=404, detail="Template not found")
     
     try:
-        template_engine = EmailTemplateEngine()
-        
-        rendered_html, tracking_data = template_engine.render_template(
+        rendered_html, tracking_data = TEMPLATE_ENGINE.render_template(
             template_content=template.html_template,
             merge_data=merge_data,
             loom_video_id=loom_video_id or template.loom_video_id,
@@ -211,10 +237,10 @@ async def create_sequence(
     try:
         # Generate slug if not provided
         if not sequence.slug:
-            sequence.slug = sequence.name.lower().replace(' ', '_').replace('-', '_')
+            sequence.slug = sequence.name.lower().translate(SLUG_TRANSLATION)
         
         # Create sequence
-        db_sequence = EmailSequence(**sequence.dict())
+        db_sequence = EmailSequence(**sequence.model_dump())
         db.add(db_sequence)
         db.commit()
         db.refresh(db_sequence)
@@ -237,15 +263,15 @@ async def get_sequences(
 ):
     """Get email sequences"""
     try:
-        query = db.query(EmailSequence)
+        query = select(*SEQUENCE_LIST_COLUMNS)
         
         if active_only:
-            query = query.filter(EmailSequence.is_active == True)
+            query = query.where(EmailSequence.is_active == True)
         if campaign_type:
-            query = query.filter(EmailSequence.campaign_type == campaign_type)
+            query = query.where(EmailSequence.campaign_type == campaign_type)
         
-        sequences = query.offset(skip).limit(limit).all()
-        return [EmailSequenceResponse.from_orm(s) for s in sequences]
+        rows = db.execute(query.offset(skip).limit(limit)).all()
+        return SEQUENCE_LIST_ADAPTER.validate_python(rows, from_attributes=True)
         
     except Exception as e:
         logger.error(f"❌ Failed to get sequences: {str(e)}")
@@ -329,29 +355,30 @@ async def get_sequence_performance(
         
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        # Get enrollments
-        enrollments = db.query(SequenceEnrollment).filter(
+        # Enrollment counts
+        total_enrollments, completed_enrollments = db.query(
+            func.count(SequenceEnrollment.id),
+            func.count().filter(SequenceEnrollment.status == SequenceStatus.COMPLETED)
+        ).filter(
             and_(
                 SequenceEnrollment.sequence_id == sequence_id,
                 SequenceEnrollment.enrolled_at >= cutoff_date
             )
-        ).all()
-        
-        # Get emails
-        emails = db.query(Email).join(SequenceStep).filter(
+        ).one()
+        
+        # Email counts (COUNT(col) skips NULLs)
+        total_emails, total_sent, total_opened, total_clicked, total_replied = db.query(
+            func.count(Email.id),
+            func.count().filter(Email.status == EmailStatus.SENT),
+            func.count(Email.opened_at),
+            func.count(Email.clicked_at),
+            func.count(Email.replied_at)
+        ).join(SequenceStep).filter(
             and_(
                 SequenceStep.sequence_id == sequence_id,
                 Email.created_at >= cutoff_date
             )
-        ).all()
-        
-        # Calculate metrics
-        total_enrollments = len(enrollments)
-        total_emails = len(emails)
-        total_sent = len([e for e in emails if e.status == EmailStatus.SENT])
-        total_opened = len([e for e in emails if e.opened_at])
-        total_clicked = len([e for e in emails if e.clicked_at])
-        total_replied = len([e for e in emails if e.replied_at])
+        ).one()
         
         metrics = {
             'sequence_id': sequence_id,
@@ -366,7 +393,7 @@ async def get_sequence_performance(
             'open_rate': (total_opened / total_sent * 100) if total_sent > 0 else 0,
             'click_rate': (total_clicked / total_sent * 100) if total_sent > 0 else 0,
             'reply_rate': (total_replied / total_sent * 100) if total_sent > 0 else 0,
-            'completion_rate': len([e for e in enrollments if e.status == SequenceStatus.COMPLETED]) / total_enrollments * 100 if total_enrollments > 0 else 0
+            'completion_rate': completed_enrollments / total_enrollments * 100 if total_enrollments > 0 else 0
         }
         
         return metrics
@@ -387,15 +414,14 @@ async def create_loom_video(
     """Register new Loom video"""
     try:
         # Get video info from Loom API
-        loom_service = LoomService()
-        video_info = loom_service.get_video_info(video.loom_id)
+        video_info = LOOM_SERVICE.get_video_info(video.loom_id)
         
         if not video_info:
             raise HTTPException(status_code=400, detail="Invalid Loom video ID")
         
         # Create video record
         db_video = LoomVideo(
-            **video.dict(),
+            **video.model_dump(),
             duration=video_info.get('duration'),
             thumbnail_url=video_info.get('thumbnail_url'),
             embed_url=video_info.get('embed_url'),
@@ -423,13 +449,13 @@ async def get_loom_videos(
 ):
     """Get Loom videos"""
     try:
-        query = db.query(LoomVideo).filter(LoomVideo.is_active == True)
+        query = select(*LOOM_VIDEO_LIST_COLUMNS).where(LoomVideo.is_active == True)
         
         if video_type:
-            query = query.filter(LoomVideo.video_type == video_type)
+            query = query.where(LoomVideo.video_type == video_type)
         
-        videos = query.offset(skip).limit(limit).all()
-        return [LoomVideoResponse.from_orm(v) for v in videos]
+        rows = db.execute(query.offset(skip).limit(limit)).all()
+        return LOOM_VIDEO_LIST_ADAPTER.validate_python(rows, from_attributes=True)
         
     except Exception as e:
         logger.error(f"❌ Failed to get Loom videos: {str(e)}")
@@ -448,8 +474,7 @@ async def generate_custom_thumbnail(
         if not video:
             raise HTTPException(status_code=404, detail="Video not found")
         
-        loom_service = LoomService()
-        thumbnail_url = loom_service.create_custom_thumbnail(
+        thumbnail_url = LOOM_SERVICE.create_custom_thumbnail(
             video.loom_id,
             lead_name,
             custom_message
@@ -477,27 +502,23 @@ async def get_analytics_overview(
     try:
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        # Get all emails in period
-        emails = db.query(Email).filter(Email.created_at >= cutoff_date).all()
-        
-        total_emails = len(emails)
-        sent_emails = [e for e in emails if e.status == EmailStatus.SENT]
-        
-        metrics = {
-            'period_days': days,
-            'total_emails': total_emails,
-            'emails_sent': len(sent_emails),
-            'emails_delivered': len([e for e in emails if e.status == EmailStatus.DELIVERED]),
-            'emails_opened': len([e for e in emails if e.opened_at]),
-            'emails_clicked': len([e for e in emails if e.clicked_at]),
-            'emails_replied': len([e for e in emails if e.replied_at]),
-            'emails_bounced': len([e for e in emails if e.status == EmailStatus.BOUNCED]),
-            'emails_spam': len([e for e in emails if e.status == EmailStatus.SPAM]),
-            'loom_clicks': len([e for e in emails if e.loom_clicked]),
-        }
+        # Count everything in one aggregate query
+        counts = db.query(
+            func.count(Email.id).label('total_emails'),
+            func.count().filter(Email.status == EmailStatus.SENT).label('emails_sent'),
+            func.count().filter(Email.status == EmailStatus.DELIVERED).label('emails_delivered'),
+            func.count(Email.opened_at).label('emails_opened'),
+            func.count(Email.clicked_at).label('emails_clicked'),
+            func.count(Email.replied_at).label('emails_replied'),
+            func.count().filter(Email.status == EmailStatus.BOUNCED).label('emails_bounced'),
+            func.count().filter(Email.status == EmailStatus.SPAM).label('emails_spam'),
+            func.count().filter(Email.loom_clicked == True).label('loom_clicks')
+        ).filter(Email.created_at >= cutoff_date).one()
+        
+        metrics = {'period_days': days, **counts._asdict()}
         
         # Calculate rates
-        if len(sent_emails) > 0:
+        if metrics['emails_sent'] > 0:
             metrics.update({
                 'delivery_rate': metrics['emails_delivered'] / metrics['emails_sent'] * 100,
                 'open_rate': metrics['emails_opened'] / metrics['emails_sent'] * 100,
@@ -531,28 +552,35 @@ async def get_template_analytics(
     try:
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        # Get templates with email stats
-        templates = db.query(EmailTemplate).all()
-        template_stats = []
+        # Templates with email stats, one grouped query (templates without emails count 0)
+        rows = db.query(
+            EmailTemplate.id,
+            EmailTemplate.name,
+            func.count().filter(Email.status == EmailStatus.SENT).label('sent'),
+            func.count(Email.opened_at).label('opened'),
+            func.count(Email.clicked_at).label('clicked'),
+            func.count(Email.replied_at).label('replied'),
+            func.count().filter(Email.loom_clicked == True).label('loom_clicks')
+        ).outerjoin(
+            Email,
+            and_(
+                Email.template_id == EmailTemplate.id,
+                Email.created_at >= cutoff_date
+            )
+        ).group_by(EmailTemplate.id, EmailTemplate.name).all()
         
-        for template in templates:
-            emails = db.query(Email).filter(
-                and_(
-                    Email.template_id == template.id,
-                    Email.created_at >= cutoff_date
-                )
-            ).all()
-            
-            sent_count = len([e for e in emails if e.status == EmailStatus.SENT])
+        template_stats = []
+        for row in rows:
+            sent_count = row.sent
             
             stats = {
-                'template_id': template.id,
-                'template_name': template.name,
+                'template_id': row.id,
+                'template_name': row.name,
                 'emails_sent': sent_count,
-                'open_rate': len([e for e in emails if e.opened_at]) / sent_count * 100 if sent_count > 0 else 0,
-                'click_rate': len([e for e in emails if e.clicked_at]) / sent_count * 100 if sent_count > 0 else 0,
-                'reply_rate': len([e for e in emails if e.replied_at]) / sent_count * 100 if sent_count > 0 else 0,
-                'loom_click_rate': len([e for e in emails if e.loom_clicked]) / sent_count * 100 if sent_count > 0 else 0
+                'open_rate': row.opened / sent_count * 100 if sent_count > 0 else 0,
+                'click_rate': row.clicked / sent_count * 100 if sent_count > 0 else 0,
+                'reply_rate': row.replied / sent_count * 100 if sent_count > 0 else 0,
+                'loom_click_rate': row.loom_clicks / sent_count * 100 if sent_count > 0 else 0
             }
             
             template_stats.append(stats)
@@ -7,7 +7,7 @@ Advanced email automation with Loom integration & personalization
 from datetime import datetime, timedelta
 from enum import Enum
 from typing import Optional, List, Dict, Any, Union
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, JSON, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from pydantic import BaseModel, EmailStr, Field, HttpUrl
@@ -284,6 +284,10 @@ class SequenceEnrollment(Base):
 
 class Email(Base):
     __tablename__ = "emails"
+    __table_args__ = (
+        # Per-template analytics over a date window
+        Index("ix_emails_template_created", "template_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     
@@ -4,13 +4,23 @@
 Advanced email personalization with video thumbnails & tracking
 """
 
+import asyncio
+import hashlib
 import os
 import re
+import threading
+import time
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, List, Optional, Any, Tuple
-from jinja2 import Environment, BaseLoader, TemplateError, select_autoescape
+from jinja2 import Environment, BaseLoader, Template, TemplateError, meta, nodes, select_autoescape
 from jinja2.sandbox import SandboxedEnvironment
+from markupsafe import Markup
+from html.parser import HTMLParser
 from urllib.parse import urlencode
 import base64
 import json
@@ -18,9 +28,190 @@ import logging
 from PIL import Image, ImageDraw, ImageFont
 import io
 import uuid
+from types import MappingProxyType
+from cachetools import TTLCache
+from concurrent.futures import Future, ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on compiled templates kept per engine
+TEMPLATE_CACHE_SIZE = 256
+
+# Concurrent renders in one render_batch call
+RENDER_MAX_CONCURRENCY = 50
+
+# Async Loom client settings
+LOOM_MAX_CONCURRENCY = 20
+LOOM_MAX_RETRIES = 3
+# Longest Retry-After we will sleep for before giving up on a 429
+LOOM_MAX_RETRY_AFTER = 5.0
+LOOM_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=64, keepalive_expiry=60)
+
+# Sync Loom client: (connect, read) timeout in seconds
+LOOM_REQUEST_TIMEOUT = (3.05, 10)
+
+# Precompiled patterns for handle and tracking extraction
+SOCIAL_HANDLE_PATTERN = re.compile(
+    r'instagram\.com/(?P<instagram>[^/?]+)'
+    r'|linkedin\.com/in/(?P<linkedin>[^/?]+)'
+    r'|twitter\.com/(?P<twitter>[^/?]+)'
+    r'|tiktok\.com/@(?P<tiktok>[^/?]+)'
+)
+LOOM_SHARE_PATTERN = re.compile(r'loom\.com/share/([a-zA-Z0-9]+)')
+
+# Loom video metadata rarely changes; one lookup per video per hour is plenty
+LOOM_CACHE_SIZE = 1024
+LOOM_CACHE_TTL_SECONDS = int(os.getenv('LOOM_CACHE_TTL_SECONDS', '3600'))
+
+# Thumbnail rendering
+THUMBNAIL_SIZE = (1280, 720)
+THUMBNAIL_QUALITY = 85
+WEBP_THUMBNAIL_QUALITY = 80
+
+# WebP data URLs are much smaller; set to 'jpeg' for clients like Outlook desktop
+THUMBNAIL_FORMAT = os.getenv('LOOM_THUMBNAIL_FORMAT', 'webp').lower()
+THUMBNAIL_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+# Shared pool for thumbnail encoding; PIL releases the GIL while encoding
+_thumbnail_pool = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+
+# Tried in order; DejaVu Sans is present on most Linux hosts without Arial
+THUMBNAIL_FONT_FILES = ("arial.ttf", "DejaVuSans.ttf")
+
+# Lookup tables for the smart_greeting() and pain_point_hook() globals
+SOURCE_GREETINGS = {
+    'instagram': "I came across your Instagram profile and was impressed!",
+    'linkedin': "I found your LinkedIn profile and love what you're doing!",
+    'twitter': "Saw your Twitter and had to reach out!"
+}
+INDUSTRY_PAIN_HOOKS = {
+    'fashion': "Tired of photographers who don't understand your vision?",
+    'beauty': "Struggling to find a photographer who captures your true essence?",
+    'fitness': "Need photos that show your dedication and results?",
+    'business': "Looking for professional headshots that actually convert?",
+    'creative': "Want photography that matches your artistic vision?",
+}
+GRADE_PAIN_HOOKS = {
+    'hot': "Ready to take your content to the next level?",
+    'warm': "Looking for photography that stands out from the crowd?"
+}
+DEFAULT_PAIN_HOOK = "Curious about premium photography services?"
+
+# Merge data used to test-render templates in validate_template
+SAMPLE_MERGE_DATA = MappingProxyType({
+    'first_name': 'John',
+    'last_name': 'Doe',
+    'company': 'Acme Corp',
+    'email': 'john@example.com'
+})
+
+# Fallbacks for missing or blank merge fields
+MERGE_DEFAULTS = MappingProxyType({
+    'first_name': 'there',
+    'last_name': '',
+    'company': 'your company',
+    'industry': 'your industry',
+    'location': 'your area',
+    'source': 'online',
+    'grade': 'potential',
+    'sender_name': 'Alex',
+    'sender_company': 'Hunter Agency'
+})
+SOCIAL_HANDLE_KEYS = tuple(
+    (platform, f'{platform}_url', f'{platform}_handle')
+    for platform in ('instagram', 'linkedin', 'twitter')
+)
+
+# Loom embed block rendered by the loom_video() template global
+LOOM_VIDEO_HTML = """
+<div style="text-align: center; margin: 30px 0; font-family: Arial, sans-serif;">
+    <a href="{{ video_url }}" target="_blank" style="text-decoration: none;">
+        <div style="position: relative; display: inline-block; border-radius: 12px; overflow: hidden; box-shadow: 0 8px 24px rgba(0,0,0,0.15); transition: transform 0.3s ease;">
+            <img src="{{ thumbnail_url }}" 
+                 alt="Personal video message for {{ lead_name or 'you' }}" 
+                 style="max-width: 100%; height: auto; display: block;">
+            
+            <!-- Play button overlay -->
+            <div style="position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); 
+                       width: 80px; height: 80px; background: rgba(0,123,255,0.9); 
+                       border-radius: 50%; display: flex; align-items: center; justify-content: center;
+                       border: 3px solid white;">
+                <div style="width: 0; height: 0; border-left: 20px solid white; 
+                           border-top: 12px solid transparent; border-bottom: 12px solid transparent;
+                           margin-left: 4px;"></div>
+            </div>
+            
+            <!-- Duration badge -->
+            <div style="position: absolute; bottom: 12px; right: 12px; 
+                       background: rgba(0,0,0,0.8); color: white; padding: 4px 8px; 
+                       border-radius: 4px; font-size: 12px; font-weight: bold;">
+                {{ duration_text }}
+            </div>
+        </div>
+        
+        <div style="margin-top: 15px; color: #007bff; font-size: 16px; font-weight: 600;">
+            ▶️ Watch my personal message for you
+        </div>
+        
+        <div style="margin-top: 5px; color: #666; font-size: 14px;">
+            {{ title }}
+        </div>
+    </a>
+</div>
+"""
+
+@lru_cache(maxsize=1)
+def _date_context(minute_bucket: int) -> Dict[str, Any]:
+    """Formatted date fields for one wall-clock minute"""
+    now = datetime.fromtimestamp(minute_bucket * 60)
+    return {
+        'current_date': now.strftime('%B %d, %Y'),
+        'current_time': now.strftime('%I:%M %p'),
+        'day_of_week': now.strftime('%A'),
+        'month': now.strftime('%B'),
+        'year': now.year
+    }
+
+@lru_cache(maxsize=1)
+def _thumbnail_fonts() -> Dict[str, Any]:
+    """Load thumbnail fonts once per process, fallback to default"""
+    for font_file in THUMBNAIL_FONT_FILES:
+        try:
+            return {
+                'subtitle': ImageFont.truetype(font_file, 40),
+                'name': ImageFont.truetype(font_file, 80)
+            }
+        except OSError:
+            continue
+    
+    default_font = ImageFont.load_default()
+    return {'subtitle': default_font, 'name': default_font}
+
+class _TrackingExtractor(HTMLParser):
+    """Collect links, images and Loom videos in a single pass over the HTML"""
+    
+    def __init__(self):
+        super().__init__()
+        self.links = set()
+        self.images = set()
+        self.loom_videos = set()
+    
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            if not value:
+                continue
+            if name == 'href':
+                self.links.add(value)
+            elif name == 'src':
+                self.images.add(value)
+            else:
+                continue
+            
+            if 'loom.com/share/' in value:
+                match = LOOM_SHARE_PATTERN.search(value)
+                if match:
+                    self.loom_videos.add(match.group(1))
+
 # ============================================================================
 # 🎬 LOOM INTEGRATION SERVICE
 # ============================================================================
@@ -32,12 +223,43 @@ class LoomService:
         self.api_key = api_key or os.getenv('LOOM_API_KEY')
         self.base_url = "https://api.loom.com/v1"
         self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=64,
+            pool_maxsize=64,
+            # Ignore Retry-After so a 429 can't park a render thread for minutes
+            max_retries=Retry(total=3, backoff_factor=0.5,
+                              status_forcelist=[429, 500, 502, 503, 504],
+                              respect_retry_after_header=False)
+        )
+        self.session.mount('https://', adapter)
+        self.session.headers['Connection'] = 'keep-alive'
+        
+        self.headers: Dict[str, str] = {}
         
         if self.api_key:
-            self.session.headers.update({
+            self.headers = {
                 'Authorization': f'Bearer {self.api_key}',
                 'Content-Type': 'application/json'
-            })
+            }
+            self.session.headers.update(self.headers)
+        
+        # Pooled async client and concurrency guard, created on first async use
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        
+        # Video info shared by the sync and async lookups; the sync path also runs in
+        # render executor threads, so every access goes through the lock
+        self._video_cache: TTLCache = TTLCache(maxsize=LOOM_CACHE_SIZE, ttl=LOOM_CACHE_TTL_SECONDS)
+        self._video_cache_lock = threading.Lock()
+        
+        # Static thumbnail layer and fonts, drawn/loaded once per service
+        self._base_thumbnail: Optional[Image.Image] = None
+        self._fonts: Dict[str, Any] = {}
+        try:
+            self._fonts = _thumbnail_fonts()
+            self._base_thumbnail = self._build_base_thumbnail()
+        except Exception as e:
+            logger.error(f"Failed to prepare thumbnail base: {str(e)}")
     
     def get_video_info(self, video_id: str) -> Optional[Dict[str, Any]]:
         """Get video information from Loom API"""
@@ -46,19 +268,19 @@ class LoomService:
                 # Fallback: generate mock data
                 return self._mock_video_info(video_id)
             
-            response = self.session.get(f"{self.base_url}/videos/{video_id}")
+            with self._video_cache_lock:
+                cached = self._video_cache.get(video_id)
+            if cached is not None:
+                return cached
+            
+            response = self.session.get(f"{self.base_url}/videos/{video_id}",
+                                        timeout=LOOM_REQUEST_TIMEOUT)
             
             if response.status_code == 200:
-                data = response.json()
-                return {
-                    'id': data.get('id'),
-                    'title': data.get('name'),
-                    'duration': data.get('duration'),
-                    'thumbnail_url': data.get('thumbnail_url'),
-                    'embed_url': data.get('embed_url'),
-                    'share_url': data.get('share_url'),
-                    'created_at': data.get('created_at')
-                }
+                video_info = self._parse_video_info(response.json())
+                with self._video_cache_lock:
+                    self._video_cache[video_id] = video_info
+                return video_info
             else:
                 logger.error(f"Failed to get Loom video {video_id}: {response.status_code}")
                 return self._mock_video_info(video_id)
@@ -67,6 +289,81 @@ class LoomService:
             logger.error(f"Error fetching Loom video {video_id}: {str(e)}")
             return self._mock_video_info(video_id)
     
+    async def aget_video_info(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """Get video information from Loom API without blocking the event loop"""
+        if not self.api_key:
+            return self._mock_video_info(video_id)
+        
+        with self._video_cache_lock:
+            cached = self._video_cache.get(video_id)
+        if cached is not None:
+            return cached
+        
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=LOOM_HTTP_LIMITS,
+                timeout=10.0
+            )
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(LOOM_MAX_CONCURRENCY)
+        
+        try:
+            async with self._semaphore:
+                for attempt in range(LOOM_MAX_RETRIES):
+                    response = await self._async_client.get(f"{self.base_url}/videos/{video_id}")
+                    if response.status_code != 429 or attempt == LOOM_MAX_RETRIES - 1:
+                        break
+                    
+                    # Rate limited: honour Retry-After up to a cap, else back off exponentially
+                    try:
+                        delay = float(response.headers.get('Retry-After', 2 ** attempt))
+                    except ValueError:
+                        delay = 2 ** attempt
+                    await asyncio.sleep(min(delay, LOOM_MAX_RETRY_AFTER))
+            
+            if response.status_code == 200:
+                video_info = self._parse_video_info(response.json())
+                with self._video_cache_lock:
+                    self._video_cache[video_id] = video_info
+                return video_info
+            
+            logger.error(f"Failed to get Loom video {video_id}: {response.status_code}")
+            return self._mock_video_info(video_id)
+        
+        except Exception as e:
+            logger.error(f"Error fetching Loom video {video_id}: {str(e)}")
+            return self._mock_video_info(video_id)
+    
+    async def aget_many(self, video_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Fetch several videos concurrently"""
+        unique_ids = list(dict.fromkeys(video_ids))
+        results = await asyncio.gather(*(self.aget_video_info(vid) for vid in unique_ids))
+        return dict(zip(unique_ids, results))
+    
+    async def aclose(self):
+        """Close the pooled async client
+        
+        The client and semaphore are rebuilt on next use, bound to whichever
+        event loop is running then.
+        """
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self._semaphore = None
+    
+    def _parse_video_info(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Map a Loom API payload to our video info shape"""
+        return {
+            'id': data.get('id'),
+            'title': data.get('name'),
+            'duration': data.get('duration'),
+            'thumbnail_url': data.get('thumbnail_url'),
+            'embed_url': data.get('embed_url'),
+            'share_url': data.get('share_url'),
+            'created_at': data.get('created_at')
+        }
+    
     def _mock_video_info(self, video_id: str) -> Dict[str, Any]:
         """Generate mock video info for development"""
         return {
@@ -94,82 +391,138 @@ class LoomService:
         
         return f"{base_url}?{urlencode(params)}"
     
+    def _build_base_thumbnail(self) -> Image.Image:
+        """Draw the parts of the thumbnail shared by every lead"""
+        img = Image.new('RGB', THUMBNAIL_SIZE, color='#1a1a1a')
+        draw = ImageDraw.Draw(img)
+        
+        # Add play button
+        play_center = (640, 360)
+        play_radius = 80
+        draw.ellipse([
+            play_center[0] - play_radius,
+            play_center[1] - play_radius,
+            play_center[0] + play_radius,
+            play_center[1] + play_radius
+        ], fill='#007bff', outline='#ffffff', width=4)
+        
+        # Play triangle
+        triangle = [
+            (play_center[0] - 20, play_center[1] - 30),
+            (play_center[0] - 20, play_center[1] + 30),
+            (play_center[0] + 25, play_center[1])
+        ]
+        draw.polygon(triangle, fill='#ffffff')
+        
+        # Duration badge
+        duration_text = "0:45"
+        draw.rectangle([50, 50, 150, 100], fill='#000000', outline='#ffffff')
+        draw.text((70, 65), duration_text, fill='#ffffff', font=self._fonts['subtitle'])
+        
+        return img
+    
+    def _build_thumbnail_image(self, lead_name: str, custom_message: str = "") -> Image.Image:
+        """Draw the personalized text over a copy of the base thumbnail"""
+        if self._base_thumbnail is None:
+            raise RuntimeError("thumbnail base unavailable")
+        
+        img = self._base_thumbnail.copy()
+        draw = ImageDraw.Draw(img)
+        name_font = self._fonts['name']
+        subtitle_font = self._fonts['subtitle']
+        
+        # Add personalized text
+        main_text = f"Hey {lead_name}! 👋"
+        bbox = draw.textbbox((0, 0), main_text, font=name_font)
+        text_width = bbox[2] - bbox[0]
+        draw.text(((THUMBNAIL_SIZE[0] - text_width) // 2, 150), main_text, 
+                 fill='#ffffff', font=name_font)
+        
+        # Subtitle
+        if custom_message:
+            subtitle = custom_message
+        else:
+            subtitle = "I made this video just for you"
+        
+        bbox = draw.textbbox((0, 0), subtitle, font=subtitle_font)
+        text_width = bbox[2] - bbox[0]
+        draw.text(((THUMBNAIL_SIZE[0] - text_width) // 2, 500), subtitle, 
+                 fill='#cccccc', font=subtitle_font)
+        
+        return img
+    
+    def _encode_data_url(self, img: Image.Image, image_format: Optional[str] = None) -> str:
+        """Encode a thumbnail as a base64 data URL"""
+        img_bytes = io.BytesIO()
+        if (image_format or THUMBNAIL_FORMAT) == 'webp':
+            img.save(img_bytes, format='WEBP', quality=WEBP_THUMBNAIL_QUALITY, method=4)
+            mime_type = 'image/webp'
+        else:
+            img.save(img_bytes, format='JPEG', quality=THUMBNAIL_QUALITY)
+            mime_type = 'image/jpeg'
+        
+        # Convert to base64 for data URL, encoding straight from the buffer
+        with img_bytes.getbuffer() as view:
+            img_base64 = base64.b64encode(view).decode('ascii')
+        
+        return f"data:{mime_type};base64,{img_base64}"
+    
+    def _fallback_thumbnail_url(self, video_id: str) -> str:
+        """Default Loom thumbnail"""
+        return f"https://cdn.loom.com/sessions/thumbnails/{video_id}-00001.jpg"
+    
     def create_custom_thumbnail(self, 
                               video_id: str, 
                               lead_name: str, 
-                              custom_message: str = "") -> str:
+                              custom_message: str = "",
+                              image_format: Optional[str] = None) -> str:
         """Create personalized thumbnail with lead name"""
         try:
-            # Create a 1280x720 thumbnail
-            img = Image.new('RGB', (1280, 720), color='#1a1a1a')
-            draw = ImageDraw.Draw(img)
-            
-            # Try to load custom font, fallback to default
-            try:
-                title_font = ImageFont.truetype("arial.ttf", 60)
-                subtitle_font = ImageFont.truetype("arial.ttf", 40)
-                name_font = ImageFont.truetype("arial.ttf", 80)
-            except:
-                title_font = ImageFont.load_default()
-                subtitle_font = ImageFont.load_default()
-                name_font = ImageFont.load_default()
-            
-            # Add play button
-            play_center = (640, 360)
-            play_radius = 80
-            draw.ellipse([
-                play_center[0] - play_radius,
-                play_center[1] - play_radius,
-                play_center[0] + play_radius,
-                play_center[1] + play_radius
-            ], fill='#007bff', outline='#ffffff', width=4)
-            
-            # Play triangle
-            triangle = [
-                (play_center[0] - 20, play_center[1] - 30),
-                (play_center[0] - 20, play_center[1] + 30),
-                (play_center[0] + 25, play_center[1])
-            ]
-            draw.polygon(triangle, fill='#ffffff')
-            
-            # Add personalized text
-            main_text = f"Hey {lead_name}! 👋"
-            bbox = draw.textbbox((0, 0), main_text, font=name_font)
-            text_width = bbox[2] - bbox[0]
-            draw.text(((1280 - text_width) // 2, 150), main_text, 
-                     fill='#ffffff', font=name_font)
-            
-            # Subtitle
-            if custom_message:
-                subtitle = custom_message
-            else:
-                subtitle = "I made this video just for you"
-            
-            bbox = draw.textbbox((0, 0), subtitle, font=subtitle_font)
-            text_width = bbox[2] - bbox[0]
-            draw.text(((1280 - text_width) // 2, 500), subtitle, 
-                     fill='#cccccc', font=subtitle_font)
-            
-            # Duration badge
-            duration_text = "0:45"
-            draw.rectangle([50, 50, 150, 100], fill='#000000', outline='#ffffff')
-            draw.text((70, 65), duration_text, fill='#ffffff', font=subtitle_font)
-            
-            # Save to bytes
-            img_bytes = io.BytesIO()
-            img.save(img_bytes, format='JPEG', quality=95)
-            img_bytes.seek(0)
-            
-            # Convert to base64 for data URL
-            img_base64 = base64.b64encode(img_bytes.getvalue()).decode()
-            
-            # Return data URL
-            return f"data:image/jpeg;base64,{img_base64}"
+            img = self._build_thumbnail_image(lead_name, custom_message)
+            return self._encode_data_url(img, image_format)
             
         except Exception as e:
             logger.error(f"Failed to create custom thumbnail: {str(e)}")
             # Fallback to default Loom thumbnail
-            return f"https://cdn.loom.com/sessions/thumbnails/{video_id}-00001.jpg"
+            return self._fallback_thumbnail_url(video_id)
+    
+    def create_custom_thumbnail_async(self, 
+                                      video_id: str, 
+                                      lead_name: str, 
+                                      custom_message: str = "",
+                                      image_format: Optional[str] = None) -> Future:
+        """Start encoding a personalized thumbnail in the background
+        
+        The text is drawn on the calling thread; the encode runs on the
+        shared pool. The returned Future resolves to the data URL, or to the
+        default Loom thumbnail if anything fails.
+        """
+        try:
+            img = self._build_thumbnail_image(lead_name, custom_message)
+        except Exception as e:
+            logger.error(f"Failed to create custom thumbnail: {str(e)}")
+            future = Future()
+            future.set_result(self._fallback_thumbnail_url(video_id))
+            return future
+        
+        def encode() -> str:
+            try:
+                return self._encode_data_url(img, image_format)
+            except Exception as e:
+                logger.error(f"Failed to encode custom thumbnail: {str(e)}")
+                return self._fallback_thumbnail_url(video_id)
+        
+        return _thumbnail_pool.submit(encode)
+    
+    def create_custom_thumbnails_batch(self, 
+                                       items: List[Tuple[str, str, str]]) -> List[str]:
+        """Create several thumbnails in parallel
+        
+        Each item is (video_id, lead_name, custom_message). Encodes for the
+        whole batch are queued before waiting on any of them.
+        """
+        futures = [self.create_custom_thumbnail_async(*item) for item in items]
+        return [future.result() for future in futures]
 
 # ============================================================================
 # 🎨 ADVANCED TEMPLATE ENGINE
@@ -188,30 +541,58 @@ class EmailTemplateEngine:
             lstrip_blocks=True
         )
         
-        # Add custom filters
-        self._register_filters()
+        # Plain environment for our own templates, skips sandbox checks
+        self.trusted_env = Environment(
+            autoescape=select_autoescape(['html', 'xml']),
+            trim_blocks=True,
+            lstrip_blocks=True
+        )
         
-        # Add custom functions
-        self._register_functions()
+        # Compiled once, autoescapes lead-supplied values
+        self._loom_html = self.trusted_env.from_string(LOOM_VIDEO_HTML)
+        
+        for env in (self.env, self.trusted_env):
+            # Add custom filters
+            self._register_filters(env)
+            
+            # Add custom functions
+            self._register_functions(env)
+        
+        # Compiled templates keyed by environment and source digest
+        self._templates: Dict[Tuple[bool, bytes], Template] = {}
+        for source in (TemplateLibrary.COLD_OUTREACH_INTRO,
+                       TemplateLibrary.FOLLOW_UP_NO_RESPONSE,
+                       TemplateLibrary.PROPOSAL_READY):
+            self._compile(source, trusted=True)
+    
+    def _compile(self, source: str, trusted: bool = False,
+                 parsed: Optional[nodes.Template] = None) -> Template:
+        """Compile template source once and reuse the Template object"""
+        key = (trusted, hashlib.blake2b(source.encode(), digest_size=16).digest())
+        template = self._templates.get(key)
+        if template is None:
+            env = self.trusted_env if trusted else self.env
+            template = env.from_string(parsed if parsed is not None else source)
+            if len(self._templates) >= TEMPLATE_CACHE_SIZE:
+                self._templates.clear()
+            self._templates[key] = template
+        return template
     
-    def _register_filters(self):
+    def _register_filters(self, env: Environment):
         """Register custom Jinja2 filters"""
         
-        @self.env.filter
         def titlecase(value):
             """Convert to title case"""
             if not value:
                 return ""
             return str(value).title()
         
-        @self.env.filter
         def first_name_only(value):
             """Extract first name from full name"""
             if not value:
                 return ""
             return str(value).split()[0]
         
-        @self.env.filter
         def format_budget(value):
             """Format budget with currency"""
             if not value:
@@ -225,28 +606,18 @@ class EmailTemplateEngine:
             except:
                 return str(value)
         
-        @self.env.filter
         def social_handle(url):
             """Extract handle from social media URL"""
             if not url:
                 return ""
             
             # Extract handle from various social media URLs
-            patterns = [
-                r'instagram\.com/([^/?]+)',
-                r'linkedin\.com/in/([^/?]+)',
-                r'twitter\.com/([^/?]+)',
-                r'tiktok\.com/@([^/?]+)'
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, url)
-                if match:
-                    return f"@{match.group(1)}"
+            match = SOCIAL_HANDLE_PATTERN.search(url)
+            if match:
+                return f"@{match.group(match.lastgroup)}"
             
             return url
         
-        @self.env.filter
         def time_of_day_greeting(value=None):
             """Generate greeting based on time of day"""
             now = datetime.now()
@@ -260,8 +631,16 @@ class EmailTemplateEngine:
                 return "Good evening"
             else:
                 return "Hope you're having a great evening"
+        
+        env.filters.update({
+            'titlecase': titlecase,
+            'first_name_only': first_name_only,
+            'format_budget': format_budget,
+            'social_handle': social_handle,
+            'time_of_day_greeting': time_of_day_greeting
+        })
     
-    def _register_functions(self):
+    def _register_functions(self, env: Environment):
         """Register custom Jinja2 global functions"""
         
         def loom_video(video_id, lead_name="", custom_message="", 
@@ -271,7 +650,7 @@ class EmailTemplateEngine:
             # Get video info
             video_info = self.loom_service.get_video_info(video_id)
             if not video_info:
-                return f"<!-- Loom video {video_id} not found -->"
+                return Markup("<!-- Loom video %s not found -->") % video_id
             
             # Generate tracking URL
             if lead_id and email_id:
@@ -293,104 +672,52 @@ class EmailTemplateEngine:
             duration = video_info.get('duration', 0)
             duration_text = f"{duration//60}:{duration%60:02d}" if duration else "0:45"
             
-            html = f"""
-            <div style="text-align: center; margin: 30px 0; font-family: Arial, sans-serif;">
-                <a href="{video_url}" target="_blank" style="text-decoration: none;">
-                    <div style="position: relative; display: inline-block; border-radius: 12px; overflow: hidden; box-shadow: 0 8px 24px rgba(0,0,0,0.15); transition: transform 0.3s ease;">
-                        <img src="{thumbnail_url}" 
-                             alt="Personal video message for {lead_name or 'you'}" 
-                             style="max-width: 100%; height: auto; display: block;">
-                        
-                        <!-- Play button overlay -->
-                        <div style="position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); 
-                                   width: 80px; height: 80px; background: rgba(0,123,255,0.9); 
-                                   border-radius: 50%; display: flex; align-items: center; justify-content: center;
-                                   border: 3px solid white;">
-                            <div style="width: 0; height: 0; border-left: 20px solid white; 
-                                       border-top: 12px solid transparent; border-bottom: 12px solid transparent;
-                                       margin-left: 4px;"></div>
-                        </div>
-                        
-                        <!-- Duration badge -->
-                        <div style="position: absolute; bottom: 12px; right: 12px; 
-                                   background: rgba(0,0,0,0.8); color: white; padding: 4px 8px; 
-                                   border-radius: 4px; font-size: 12px; font-weight: bold;">
-                            {duration_text}
-                        </div>
-                    </div>
-                    
-                    <div style="margin-top: 15px; color: #007bff; font-size: 16px; font-weight: 600;">
-                        ▶️ Watch my personal message for you
-                    </div>
-                    
-                    <div style="margin-top: 5px; color: #666; font-size: 14px;">
-                        {video_info.get('title', 'Personal Video Message')}
-                    </div>
-                </a>
-            </div>
-            """
+            html = self._loom_html.render(
+                video_url=video_url,
+                thumbnail_url=thumbnail_url,
+                lead_name=lead_name,
+                duration_text=duration_text,
+                title=video_info.get('title', 'Personal Video Message')
+            )
             
-            return html
+            return Markup(html)
         
         def smart_greeting(lead_data):
             """Generate smart greeting based on lead info"""
             first_name = lead_data.get('first_name', '')
-            source = lead_data.get('source', '')
-            industry = lead_data.get('industry', '')
+            greeting = f"Hey {first_name}! 👋" if first_name else "Hello! 👋"
             
-            greetings = []
-            
-            if first_name:
-                greetings.append(f"Hey {first_name}! 👋")
-            else:
-                greetings.append("Hello! 👋")
-            
-            if source == 'instagram':
-                greetings.append("I came across your Instagram profile and was impressed!")
-            elif source == 'linkedin':
-                greetings.append("I found your LinkedIn profile and love what you're doing!")
-            elif source == 'twitter':
-                greetings.append("Saw your Twitter and had to reach out!")
-            
-            return " ".join(greetings)
+            source_greeting = SOURCE_GREETINGS.get(lead_data.get('source', ''))
+            if source_greeting:
+                return f"{greeting} {source_greeting}"
+            return greeting
         
         def pain_point_hook(lead_data):
             """Generate pain point hook based on lead industry/source"""
-            industry = lead_data.get('industry', '').lower()
-            source = lead_data.get('source', '').lower()
-            grade = lead_data.get('grade', '').lower()
-            
-            hooks = {
-                'fashion': "Tired of photographers who don't understand your vision?",
-                'beauty': "Struggling to find a photographer who captures your true essence?",
-                'fitness': "Need photos that show your dedication and results?",
-                'business': "Looking for professional headshots that actually convert?",
-                'creative': "Want photography that matches your artistic vision?",
-            }
-            
-            if industry in hooks:
-                return hooks[industry]
+            hook = INDUSTRY_PAIN_HOOKS.get(lead_data.get('industry', '').lower())
+            if hook:
+                return hook
             
             # Fallback based on grade
-            if grade == 'hot':
-                return "Ready to take your content to the next level?"
-            elif grade == 'warm':
-                return "Looking for photography that stands out from the crowd?"
-            else:
-                return "Curious about premium photography services?"
+            return GRADE_PAIN_HOOKS.get(lead_data.get('grade', '').lower(), DEFAULT_PAIN_HOOK)
         
         # Register functions
-        self.env.globals['loom_video'] = loom_video
-        self.env.globals['smart_greeting'] = smart_greeting
-        self.env.globals['pain_point_hook'] = pain_point_hook
+        env.globals['loom_video'] = loom_video
+        env.globals['smart_greeting'] = smart_greeting
+        env.globals['pain_point_hook'] = pain_point_hook
     
     def render_template(self, 
                        template_content: str, 
                        merge_data: Dict[str, Any],
                        loom_video_id: Optional[str] = None,
                        lead_id: Optional[int] = None,
-                       email_id: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
-        """Render email template with merge data and Loom integration"""
+                       email_id: Optional[int] = None,
+                       trusted: bool = False) -> Tuple[str, Dict[str, Any]]:
+        """Render email template with merge data and Loom integration
+        
+        Pass trusted=True only for our own templates (TemplateLibrary); they
+        render without the sandbox's per-access checks.
+        """
         
         try:
             # Prepare enhanced merge data
@@ -404,8 +731,8 @@ class EmailTemplateEngine:
                     'email_id': email_id
                 })
             
-            # Create template
-            template = self.env.from_string(template_content)
+            # Get compiled template
+            template = self._compile(template_content, trusted=trusted)
             
             # Render with enhanced data
             rendered_content = template.render(**enhanced_data)
@@ -423,47 +750,56 @@ class EmailTemplateEngine:
             logger.error(f"Unexpected error rendering template: {str(e)}")
             raise ValueError(f"Rendering failed: {str(e)}")
     
-    def _prepare_merge_data(self, merge_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Prepare and enhance merge data with dynamic values"""
+    async def render_template_async(self, **kwargs) -> Tuple[str, Dict[str, Any]]:
+        """Render off the event loop, fetching the Loom video without blocking
         
-        enhanced_data = merge_data.copy()
+        Takes the same keyword arguments as render_template.
+        """
+        loom_video_id = kwargs.get('loom_video_id')
+        if loom_video_id:
+            await self.loom_service.aget_video_info(loom_video_id)
         
-        # Add current date/time data
-        now = datetime.now()
-        enhanced_data.update({
-            'current_date': now.strftime('%B %d, %Y'),
-            'current_time': now.strftime('%I:%M %p'),
-            'day_of_week': now.strftime('%A'),
-            'month': now.strftime('%B'),
-            'year': now.year
-        })
+        # Thumbnail encoding releases the GIL, so renders overlap in the pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.render_template(**kwargs))
+    
+    async def render_batch(self, renders: List[Dict[str, Any]]) -> List[Any]:
+        """Render a batch of emails concurrently
+        
+        Each item holds the keyword arguments for render_template. Failed
+        renders come back as the exception instead of aborting the batch.
+        """
+        semaphore = asyncio.Semaphore(RENDER_MAX_CONCURRENCY)
+        
+        async def render_one(render: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+            async with semaphore:
+                return await self.render_template_async(**render)
+        
+        return await asyncio.gather(*(render_one(r) for r in renders), return_exceptions=True)
+    
+    def _prepare_merge_data(self, merge_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Prepare and enhance merge data with dynamic values"""
         
-        # Ensure required fields have defaults
-        defaults = {
-            'first_name': 'there',
-            'last_name': '',
-            'full_name': enhanced_data.get('first_name', 'there'),
-            'company': 'your company',
-            'industry': 'your industry',
-            'location': 'your area',
-            'source': 'online',
-            'grade': 'potential',
-            'sender_name': 'Alex',
-            'sender_company': 'Hunter Agency'
+        # Defaults, lead data, then current date/time (formatted once per minute)
+        enhanced_data = {
+            **MERGE_DEFAULTS,
+            **merge_data,
+            **_date_context(int(time.time() // 60))
         }
         
-        for key, default_value in defaults.items():
-            if key not in enhanced_data or not enhanced_data[key]:
+        # Blank values fall back to the defaults too
+        for key, default_value in MERGE_DEFAULTS.items():
+            if not enhanced_data[key]:
                 enhanced_data[key] = default_value
         
         # Generate derived fields
-        if enhanced_data.get('first_name') and enhanced_data.get('last_name'):
+        if enhanced_data['last_name']:
             enhanced_data['full_name'] = f"{enhanced_data['first_name']} {enhanced_data['last_name']}"
+        elif not enhanced_data.get('full_name'):
+            enhanced_data['full_name'] = enhanced_data['first_name']
         
         # Social media handles
-        for platform in ['instagram', 'linkedin', 'twitter']:
-            url_key = f'{platform}_url'
-            handle_key = f'{platform}_handle'
+        for platform, url_key, handle_key in SOCIAL_HANDLE_KEYS:
             if enhanced_data.get(url_key) and not enhanced_data.get(handle_key):
                 enhanced_data[handle_key] = self._extract_social_handle(
                     enhanced_data[url_key], platform
@@ -476,64 +812,42 @@ class EmailTemplateEngine:
         if not url:
             return ""
         
-        patterns = {
-            'instagram': r'instagram\.com/([^/?]+)',
-            'linkedin': r'linkedin\.com/in/([^/?]+)',
-            'twitter': r'twitter\.com/([^/?]+)'
-        }
-        
-        pattern = patterns.get(platform)
-        if pattern:
-            match = re.search(pattern, url)
-            if match:
-                return f"@{match.group(1)}"
+        match = SOCIAL_HANDLE_PATTERN.search(url)
+        if match and match.lastgroup == platform:
+            return f"@{match.group(platform)}"
         
         return url
     
     def _extract_tracking_data(self, rendered_content: str) -> Dict[str, Any]:
         """Extract tracking data from rendered content"""
-        tracking_data = {
-            'loom_videos': [],
-            'links': [],
-            'images': []
-        }
-        
-        # Extract Loom video references
-        loom_pattern = r'loom\.com/share/([a-zA-Z0-9]+)'
-        loom_matches = re.findall(loom_pattern, rendered_content)
-        tracking_data['loom_videos'] = list(set(loom_matches))
-        
-        # Extract all links
-        link_pattern = r'href="([^"]+)"'
-        link_matches = re.findall(link_pattern, rendered_content)
-        tracking_data['links'] = list(set(link_matches))
-        
-        # Extract images
-        img_pattern = r'src="([^"]+)"'
-        img_matches = re.findall(img_pattern, rendered_content)
-        tracking_data['images'] = list(set(img_matches))
+        parser = _TrackingExtractor()
+        parser.feed(rendered_content)
+        parser.close()
         
-        return tracking_data
+        return {
+            'loom_videos': list(parser.loom_videos),
+            'links': list(parser.links),
+            'images': list(parser.images)
+        }
     
     def validate_template(self, template_content: str) -> Dict[str, Any]:
         """Validate template syntax and extract metadata"""
         try:
-            # Parse template
-            template = self.env.from_string(template_content)
+            # Parse once; the AST feeds both metadata and compilation
+            parsed = self.env.parse(template_content)
+            template = self._compile(template_content, parsed=parsed)
             
             # Extract variables
-            variables = list(template.meta.find_undeclared_variables(template.new_context()))
+            variables = list(meta.find_undeclared_variables(parsed))
+            loom_videos = sum(
+                1 for call in parsed.find_all(nodes.Call)
+                if isinstance(call.node, nodes.Name) and call.node.name == 'loom_video'
+            )
             
             # Test render with sample data
-            sample_data = {
-                'first_name': 'John',
-                'last_name': 'Doe',
-                'company': 'Acme Corp',
-                'email': 'john@example.com'
-            }
-            
+            render_error = None
             try:
-                test_render = template.render(**sample_data)
+                template.render(**SAMPLE_MERGE_DATA)
                 render_success = True
             except Exception as e:
                 render_success = False
@@ -543,9 +857,9 @@ class EmailTemplateEngine:
                 'valid': True,
                 'variables': variables,
                 'render_success': render_success,
-                'render_error': render_error if not render_success else None,
+                'render_error': render_error,
                 'estimated_length': len(template_content),
-                'loom_videos': len(re.findall(r'loom_video\(', template_content))
+                'loom_videos': loom_videos
             }
             
         except TemplateError as e:
@@ -692,7 +1006,8 @@ def demo_template_engine():
             merge_data=lead_data,
             loom_video_id='abc123def456',
             lead_id=123,
-            email_id=456
+            email_id=456,
+            trusted=True
         )
         
         print("✅ Template rendered successfully!")
@@ -4,12 +4,80 @@ Gestion des leads et des opportunites commerciales
 """
 
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import ORJSONResponse
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel, EmailStr
-import aiosqlite
+from cachetools import TTLCache
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-router = APIRouter(prefix="/pipeline", tags=["pipeline"])
+DATABASE_URL = "sqlite+aiosqlite:///./hunter_agency.db"
+
+# SQLite serializes writers, so a handful of connections is all the pool needs.
+# aiosqlite file databases default to NullPool, so ask for a queue pool explicitly.
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"timeout": 30},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=5,
+    max_overflow=5,
+    pool_recycle=3600,
+    pool_pre_ping=True,
+    query_cache_size=1200
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL + NORMAL sync: readers don't block the writer, fsync only at checkpoints"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.close()
+
+# Statements built once and reused by every request
+INSERT_LEAD = text("""
+    INSERT INTO pipeline_leads 
+    (email, first_name, last_name, company, phone, source, industry, budget_range, notes, status, created_at)
+    VALUES (:email, :first_name, :last_name, :company, :phone, :source, :industry, :budget_range, :notes, 'new', :created_at)
+""")
+SELECT_LEADS = text("SELECT * FROM pipeline_leads ORDER BY created_at DESC LIMIT :limit")
+SELECT_LEADS_BY_STATUS = text(
+    "SELECT * FROM pipeline_leads WHERE status = :status ORDER BY created_at DESC LIMIT :limit"
+)
+SELECT_LEAD = text("SELECT * FROM pipeline_leads WHERE id = :id")
+INSERT_OPPORTUNITY = text("""
+    INSERT INTO pipeline_opportunities 
+    (lead_id, title, value, stage, close_date, probability, description, created_at)
+    VALUES (:lead_id, :title, :value, :stage, :close_date, :probability, :description, :created_at)
+""")
+LEADS_BY_STATUS = text("""
+    SELECT status, COUNT(*) as count 
+    FROM pipeline_leads 
+    GROUP BY status
+""")
+OPPORTUNITIES_BY_STAGE = text("""
+    SELECT stage, COUNT(*) as count, SUM(value) as total_value
+    FROM pipeline_opportunities 
+    GROUP BY stage
+""")
+CONVERSION_COUNTS = text("""
+    SELECT 
+        COUNT(DISTINCT pl.id) as total_leads,
+        COUNT(DISTINCT po.id) as total_opportunities
+    FROM pipeline_leads pl
+    LEFT JOIN pipeline_opportunities po ON pl.id = po.lead_id
+""")
+
+# Pipeline analytics are polled by dashboards; recompute at most every few seconds
+ANALYTICS_CACHE_TTL_SECONDS = 5
+_analytics_cache: TTLCache = TTLCache(maxsize=1, ttl=ANALYTICS_CACHE_TTL_SECONDS)
+
+router = APIRouter(prefix="/pipeline", tags=["pipeline"], default_response_class=ORJSONResponse)
 
 class LeadCreate(BaseModel):
     email: EmailStr
@@ -41,157 +109,145 @@ class OpportunityCreate(BaseModel):
     probability: float = 0.25
     description: Optional[str] = None
 
-@router.post("/leads", response_model=dict)
+@router.post("/leads")
 async def create_lead(lead: LeadCreate):
     """Creer un nouveau lead"""
     try:
-        async with aiosqlite.connect("hunter_agency.db") as db:
-            cursor = await db.execute("""
-                INSERT INTO pipeline_leads 
-                (email, first_name, last_name, company, phone, source, industry, budget_range, notes, status, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'new', ?)
-            """, (
-                lead.email, lead.first_name, lead.last_name,
-                lead.company, lead.phone, lead.source,
-                lead.industry, lead.budget_range, lead.notes,
-                datetime.now()
-            ))
+        async with engine.begin() as conn:
+            result = await conn.execute(INSERT_LEAD, {
+                **lead.model_dump(),
+                "created_at": datetime.now()
+            })
             
-            lead_id = cursor.lastrowid
-            await db.commit()
-            
-            return {
-                "id": lead_id,
-                "message": "Lead cree avec succes",
-                "email": lead.email,
-                "status": "new"
-            }
+            lead_id = result.lastrowid
+        
+        # Invalidate only once the transaction has committed
+        _analytics_cache.clear()
+        
+        return {
+            "id": lead_id,
+            "message": "Lead cree avec succes",
+            "email": lead.email,
+            "status": "new"
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur creation lead: {str(e)}")
 
-@router.get("/leads", response_model=List[dict])
+@router.get("/leads")
 async def get_leads(status: Optional[str] = None, limit: int = 50):
     """Recuperer la liste des leads"""
     try:
-        async with aiosqlite.connect("hunter_agency.db") as db:
+        async with engine.connect() as conn:
             if status:
-                query = "SELECT * FROM pipeline_leads WHERE status = ? ORDER BY created_at DESC LIMIT ?"
-                cursor = await db.execute(query, (status, limit))
+                result = await conn.execute(SELECT_LEADS_BY_STATUS, {"status": status, "limit": limit})
             else:
-                query = "SELECT * FROM pipeline_leads ORDER BY created_at DESC LIMIT ?"
-                cursor = await db.execute(query, (limit,))
-            
-            rows = await cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
+                result = await conn.execute(SELECT_LEADS, {"limit": limit})
             
-            leads = [dict(zip(columns, row)) for row in rows]
-            return leads
+            # Returning the response directly skips FastAPI's jsonable_encoder pass over every row
+            return ORJSONResponse([dict(row) for row in result.mappings()])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur recuperation leads: {str(e)}")
 
-@router.get("/leads/{lead_id}", response_model=dict)
+@router.get("/leads/{lead_id}")
 async def get_lead(lead_id: int):
     """Recuperer un lead specifique"""
     try:
-        async with aiosqlite.connect("hunter_agency.db") as db:
-            cursor = await db.execute("SELECT * FROM pipeline_leads WHERE id = ?", (lead_id,))
-            row = await cursor.fetchone()
+        async with engine.connect() as conn:
+            result = await conn.execute(SELECT_LEAD, {"id": lead_id})
+            row = result.mappings().first()
             
             if not row:
                 raise HTTPException(status_code=404, detail="Lead non trouve")
             
-            columns = [desc[0] for desc in cursor.description]
-            return dict(zip(columns, row))
+            return dict(row)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur recuperation lead: {str(e)}")
 
-@router.put("/leads/{lead_id}", response_model=dict)
+@router.put("/leads/{lead_id}")
 async def update_lead(lead_id: int, lead_update: LeadUpdate):
     """Mettre a jour un lead"""
     try:
         update_fields = []
-        values = []
+        values = {}
         
-        for field, value in lead_update.dict(exclude_unset=True).items():
-            if value is not None:
-                update_fields.append(f"{field} = ?")
-                values.append(value)
+        for field, value in lead_update.model_dump(exclude_unset=True, exclude_none=True).items():
+            update_fields.append(f"{field} = :{field}")
+            values[field] = value
         
         if not update_fields:
             raise HTTPException(status_code=400, detail="Aucun champ a mettre a jour")
         
-        values.append(datetime.now())
-        values.append(lead_id)
+        values["updated_at"] = datetime.now()
+        values["id"] = lead_id
         
-        query = f"UPDATE pipeline_leads SET {', '.join(update_fields)}, updated_at = ? WHERE id = ?"
+        query = (
+            f"UPDATE pipeline_leads SET {', '.join(update_fields)}, updated_at = :updated_at "
+            "WHERE id = :id RETURNING *"
+        )
         
-        async with aiosqlite.connect("hunter_agency.db") as db:
-            await db.execute(query, values)
-            await db.commit()
+        async with engine.begin() as conn:
+            result = await conn.execute(text(query), values)
+            row = result.mappings().first()
             
-            return {"message": "Lead mis a jour avec succes", "id": lead_id}
+            if not row:
+                raise HTTPException(status_code=404, detail="Lead non trouve")
+            
+            lead = dict(row)
+        
+        if "status" in values:
+            _analytics_cache.clear()
+        
+        return {"message": "Lead mis a jour avec succes", "id": lead_id, "lead": lead}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur mise a jour lead: {str(e)}")
 
-@router.post("/opportunities", response_model=dict)
+@router.post("/opportunities")
 async def create_opportunity(opportunity: OpportunityCreate):
     """Creer une nouvelle opportunite"""
     try:
-        async with aiosqlite.connect("hunter_agency.db") as db:
-            cursor = await db.execute("""
-                INSERT INTO pipeline_opportunities 
-                (lead_id, title, value, stage, close_date, probability, description, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                opportunity.lead_id, opportunity.title, opportunity.value,
-                opportunity.stage, opportunity.close_date, opportunity.probability,
-                opportunity.description, datetime.now()
-            ))
+        async with engine.begin() as conn:
+            result = await conn.execute(INSERT_OPPORTUNITY, {
+                **opportunity.model_dump(),
+                "created_at": datetime.now()
+            })
             
-            opp_id = cursor.lastrowid
-            await db.commit()
-            
-            return {
-                "id": opp_id,
-                "message": "Opportunite creee avec succes",
-                "value": opportunity.value,
-                "stage": opportunity.stage
-            }
+            opp_id = result.lastrowid
+        
+        _analytics_cache.clear()
+        
+        return {
+            "id": opp_id,
+            "message": "Opportunite creee avec succes",
+            "value": opportunity.value,
+            "stage": opportunity.stage
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur creation opportunite: {str(e)}")
 
-@router.get("/analytics", response_model=dict)
+@router.get("/analytics")
 async def get_pipeline_analytics():
     """Recuperer les analytics du pipeline"""
+    cached = _analytics_cache.get("analytics")
+    if cached is not None:
+        return cached
+    
     try:
-        async with aiosqlite.connect("hunter_agency.db") as db:
+        async with engine.connect() as conn:
             # Leads par statut
-            cursor = await db.execute("""
-                SELECT status, COUNT(*) as count 
-                FROM pipeline_leads 
-                GROUP BY status
-            """)
-            status_counts = dict(await cursor.fetchall())
+            result = await conn.execute(LEADS_BY_STATUS)
+            status_counts = dict(result.all())
             
             # Opportunites par etape
-            cursor = await db.execute("""
-                SELECT stage, COUNT(*) as count, SUM(value) as total_value
-                FROM pipeline_opportunities 
-                GROUP BY stage
-            """)
-            stage_data = await cursor.fetchall()
+            result = await conn.execute(OPPORTUNITIES_BY_STAGE)
+            stage_data = result.all()
             
             # Conversion rates
-            cursor = await db.execute("""
-                SELECT 
-                    COUNT(DISTINCT pl.id) as total_leads,
-                    COUNT(DISTINCT po.id) as total_opportunities
-                FROM pipeline_leads pl
-                LEFT JOIN pipeline_opportunities po ON pl.id = po.lead_id
-            """)
-            conversion_data = await cursor.fetchone()
+            result = await conn.execute(CONVERSION_COUNTS)
+            conversion_data = result.one()
             
-            return {
+            analytics = {
                 "leads_by_status": status_counts,
                 "opportunities_by_stage": [
                     {"stage": row[0], "count": row[1], "value": row[2] or 0}
@@ -202,5 +258,7 @@ async def get_pipeline_analytics():
                     if conversion_data[0] > 0 else 0
                 )
             }
+            _analytics_cache["analytics"] = analytics
+            return analytics
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur analytics: {str(e)}")
\ No newline at end of file
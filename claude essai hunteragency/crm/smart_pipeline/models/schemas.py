@@ -1,6 +1,6 @@
 """
-= CRM SMART PIPELINE - SCHEMAS
-Modules de donnes pour le pipeline CRM
+📊 CRM SMART PIPELINE - SCHEMAS
+Modules de données pour le pipeline CRM
 """
 
 from pydantic import BaseModel, EmailStr, validator
@@ -65,7 +65,7 @@ class Lead(BaseModel):
     @validator('score')
     def validate_score(cls, v):
         if v is not None and (v < 0 or v > 10):
-            raise ValueError('Le score doit tre entre 0 et 10')
+            raise ValueError('Le score doit être entre 0 et 10')
         return v
 
 class LeadCreate(BaseModel):
@@ -108,13 +108,13 @@ class Opportunity(BaseModel):
     @validator('value')
     def validate_value(cls, v):
         if v < 0:
-            raise ValueError('La valeur doit tre positive')
+            raise ValueError('La valeur doit être positive')
         return v
     
     @validator('probability')
     def validate_probability(cls, v):
         if v < 0 or v > 1:
-            raise ValueError('La probabilit doit tre entre 0 et 1')
+            raise ValueError('La probabilité doit être entre 0 et 1')
         return v
 
 class OpportunityCreate(BaseModel):
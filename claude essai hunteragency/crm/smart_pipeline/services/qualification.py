@@ -1,5 +1,5 @@
 """
-< CRM SMART PIPELINE - SERVICE DE QUALIFICATION
+🎯 CRM SMART PIPELINE - SERVICE DE QUALIFICATION
 Qualification automatique et scoring des leads
 """
 
@@ -9,10 +9,13 @@ from datetime import datetime, timedelta
 import aiosqlite
 from ..models.schemas import Lead, QualificationCriteria, LeadScoreBreakdown
 
+# Nombre de leads qualifies simultanement par bulk_qualify_leads
+BULK_QUALIFY_CONCURRENCY = 10
+
 class LeadQualificationService:
     """
     Service de qualification automatique des leads
-    Intgre scoring IA + critres BANT + analyse comportementale
+    Intègre scoring IA + critères BANT + analyse comportementale
     """
     
     def __init__(self):
@@ -29,16 +32,17 @@ class LeadQualificationService:
             'cold': 4.0
         }
     
-    async def qualify_lead(self, lead_id: int) -> Dict[str, Any]:
+    async def qualify_lead(self, lead_id: int, persist: bool = True) -> Dict[str, Any]:
         """
-        Qualification complte d'un lead
+        Qualification complète d'un lead
         Retourne le score, la classification et les recommandations
+        Avec persist=False, l'appelant se charge de la mise à jour en base
         """
         try:
-            # 1. Rcuprer les donnes du lead
+            # 1. Récupérer les données du lead
             lead_data = await self._get_lead_data(lead_id)
             if not lead_data:
-                raise ValueError(f"Lead {lead_id} non trouv")
+                raise ValueError(f"Lead {lead_id} non trouvé")
             
             # 2. Analyse BANT (Budget, Authority, Need, Timeline)
             bant_score = await self._analyze_bant_criteria(lead_data)
@@ -46,13 +50,13 @@ class LeadQualificationService:
             # 3. Scoring comportemental
             behavioral_score = await self._analyze_behavioral_data(lead_id)
             
-            # 4. Scoring dmographique/firmographique
+            # 4. Scoring démographique/firmographique
             demographic_score = await self._analyze_demographic_fit(lead_data)
             
             # 5. Engagement scoring
-            engagement_score = await self._analyze_engagement_level(lead_id)
+            engagement_score = await self._analyze_engagement_level(lead_data)
             
-            # 6. Score final pondr
+            # 6. Score final pondéré
             final_score = self._calculate_weighted_score(
                 bant_score, behavioral_score, demographic_score, engagement_score
             )
@@ -61,8 +65,9 @@ class LeadQualificationService:
             classification = self._classify_lead(final_score)
             recommendations = await self._generate_recommendations(lead_data, final_score, classification)
             
-            # 8. Mise  jour en base
-            await self._update_lead_qualification(lead_id, final_score, classification)
+            # 8. Mise à jour en base
+            if persist:
+                await self._update_lead_qualification(lead_id, final_score, classification)
             
             return {
                 'lead_id': lead_id,
@@ -84,7 +89,7 @@ class LeadQualificationService:
             return self._default_qualification_result(lead_id)
     
     async def _get_lead_data(self, lead_id: int) -> Optional[Dict]:
-        """Rcuprer les donnes compltes du lead"""
+        """Récupérer les données complètes du lead"""
         try:
             async with aiosqlite.connect("hunter_agency.db") as db:
                 cursor = await db.execute("""
@@ -97,17 +102,17 @@ class LeadQualificationService:
                     return dict(zip(columns, row))
                 return None
         except Exception as e:
-            print(f"Erreur rcupration lead {lead_id}: {e}")
+            print(f"Erreur récupération lead {lead_id}: {e}")
             return None
     
     async def _analyze_bant_criteria(self, lead_data: Dict) -> float:
         """
-        Analyse des critres BANT (Budget, Authority, Need, Timeline)
-        Score sur 10 bas sur les informations disponibles
+        Analyse des critères BANT (Budget, Authority, Need, Timeline)
+        Score sur 10 basé sur les informations disponibles
         """
         score = 0.0
         
-        # Budget - bas sur budget_range et company size
+        # Budget - basé sur budget_range et company size
         budget_score = 0.0
         budget_range = lead_data.get('budget_range', '')
         if budget_range:
@@ -120,27 +125,27 @@ class LeadQualificationService:
             else:
                 budget_score = 2.5
         
-        # Authority - bas sur le titre/fonction
+        # Authority - basé sur le titre/fonction
         authority_score = 0.0
         company = lead_data.get('company', '')
         first_name = lead_data.get('first_name', '')
         
-        # Indicateurs d'autorit dans les donnes
+        # Indicateurs d'autorité dans les données
         authority_indicators = ['ceo', 'founder', 'director', 'vp', 'head', 'manager', 'owner']
         notes = lead_data.get('notes', '').lower()
         
         if any(indicator in notes for indicator in authority_indicators):
             authority_score = 8.0
-        elif company:  # A une entreprise = potentiellement dcideur
+        elif company:  # A une entreprise = potentiellement décideur
             authority_score = 6.0
         else:
             authority_score = 3.0
         
-        # Need - bas sur l'industrie et les notes
+        # Need - basé sur l'industrie et les notes
         need_score = 0.0
         industry = lead_data.get('industry', '').lower()
         
-        # Industries  fort besoin pour nos services
+        # Industries à fort besoin pour nos services
         high_need_industries = ['saas', 'ecommerce', 'agency', 'consulting', 'fintech', 'marketing']
         if any(ind in industry for ind in high_need_industries):
             need_score = 8.0
@@ -149,14 +154,14 @@ class LeadQualificationService:
         else:
             need_score = 3.0
         
-        # Timeline - bas sur l'urgence perue
-        timeline_score = 5.0  # Score neutre par dfaut
+        # Timeline - basé sur l'urgence perçue
+        timeline_score = 5.0  # Score neutre par défaut
         if 'urgent' in notes or 'asap' in notes:
             timeline_score = 9.0
         elif 'soon' in notes or 'quick' in notes:
             timeline_score = 7.0
         
-        # Score BANT pondr
+        # Score BANT pondéré
         weighted_score = (
             budget_score * self.bant_weights['budget'] +
             authority_score * self.bant_weights['authority'] +
@@ -168,7 +173,7 @@ class LeadQualificationService:
     
     async def _analyze_behavioral_data(self, lead_id: int) -> float:
         """
-        Analyse comportementale base sur les interactions
+        Analyse comportementale basée sur les interactions
         """
         try:
             async with aiosqlite.connect("hunter_agency.db") as db:
@@ -182,14 +187,14 @@ class LeadQualificationService:
                 """, (lead_id,))
                 email_data = await cursor.fetchone()
                 
-                if email_data and email_data[0] > 0:  # A reu des emails
+                if email_data and email_data[0] > 0:  # A reçu des emails
                     email_count, opens, clicks = email_data
                     
-                    # Scoring bas sur l'engagement email
+                    # Scoring basé sur l'engagement email
                     engagement_rate = (opens + clicks * 2) / email_count
                     behavioral_score = min(engagement_rate * 5, 10.0)
                     
-                    # Bonus pour les clics (plus engag)
+                    # Bonus pour les clics (plus engagé)
                     if clicks > 0:
                         behavioral_score += 2.0
                     
@@ -203,11 +208,11 @@ class LeadQualificationService:
     
     async def _analyze_demographic_fit(self, lead_data: Dict) -> float:
         """
-        Analyse dmographique et firmographique
+        Analyse démographique et firmographique
         """
         score = 5.0  # Score de base
         
-        # Qualit de l'email
+        # Qualité de l'email
         email = lead_data.get('email', '')
         if email:
             domain = email.split('@')[1].lower() if '@' in email else ''
@@ -221,7 +226,7 @@ class LeadQualificationService:
             if any(indicator in domain for indicator in ['.co', '.inc', '.llc', '.corp']):
                 score += 1.0
         
-        # Prsence d'informations compltes
+        # Présence d'informations complètes
         completeness_score = 0
         fields_to_check = ['first_name', 'company', 'phone', 'industry']
         
@@ -231,7 +236,7 @@ class LeadQualificationService:
         
         score += completeness_score
         
-        # Source de qualit
+        # Source de qualité
         source = lead_data.get('source', '').lower()
         source_scores = {
             'referral': 2.0,
@@ -245,41 +250,37 @@ class LeadQualificationService:
         
         return min(score, 10.0)
     
-    async def _analyze_engagement_level(self, lead_id: int) -> float:
+    async def _analyze_engagement_level(self, lead_data: Dict) -> float:
         """
         Analyse du niveau d'engagement global
         """
         try:
-            async with aiosqlite.connect("hunter_agency.db") as db:
-                # Dernire activit
-                cursor = await db.execute("""
-                    SELECT last_contact FROM pipeline_leads WHERE id = ?
-                """, (lead_id,))
-                result = await cursor.fetchone()
+            # Dernière activité, déjà chargée avec le lead
+            last_contact_value = lead_data.get('last_contact')
+            
+            if last_contact_value:
+                last_contact = datetime.fromisoformat(last_contact_value)
+                days_since_contact = (datetime.now() - last_contact).days
                 
-                if result and result[0]:
-                    last_contact = datetime.fromisoformat(result[0])
-                    days_since_contact = (datetime.now() - last_contact).days
-                    
-                    # Score bas sur la rcence du contact
-                    if days_since_contact <= 7:
-                        return 9.0  # Trs rcent
-                    elif days_since_contact <= 30:
-                        return 7.0  # Rcent
-                    elif days_since_contact <= 90:
-                        return 5.0  # Moyen
-                    else:
-                        return 3.0  # Ancien
+                # Score basé sur la récence du contact
+                if days_since_contact <= 7:
+                    return 9.0  # Très récent
+                elif days_since_contact <= 30:
+                    return 7.0  # Récent
+                elif days_since_contact <= 90:
+                    return 5.0  # Moyen
                 else:
-                    return 6.0  # Nouveau lead, potentiel moyen
-                    
+                    return 3.0  # Ancien
+            else:
+                return 6.0  # Nouveau lead, potentiel moyen
+                
         except Exception as e:
             print(f"Erreur analyse engagement: {e}")
             return 5.0
     
     def _calculate_weighted_score(self, bant: float, behavioral: float, demographic: float, engagement: float) -> float:
         """
-        Calcul du score final pondr
+        Calcul du score final pondéré
         """
         weights = {
             'bant': 0.40,
@@ -310,38 +311,38 @@ class LeadQualificationService:
     
     async def _generate_recommendations(self, lead_data: Dict, score: float, classification: str) -> List[str]:
         """
-        Gnrer des recommandations personnalises
+        Générer des recommandations personnalisées
         """
         recommendations = []
         
         if classification == 'HOT':
             recommendations.extend([
-                "Contacter immdiatement par tlphone",
-                "Proposer un appel de dcouverte dans les 24h",
-                "Prparer une proposition personnalise"
+                "Contacter immédiatement par téléphone",
+                "Proposer un appel de découverte dans les 24h",
+                "Préparer une proposition personnalisée"
             ])
         elif classification == 'WARM':
             recommendations.extend([
-                "Lancer une squence email personnalise",
+                "Lancer une séquence email personnalisée",
                 "Programmer un suivi dans 3-5 jours",
-                "Envoyer du contenu ducatif pertinent"
+                "Envoyer du contenu éducatif pertinent"
             ])
         elif classification == 'COLD':
             recommendations.extend([
-                "Ajouter  la campagne de nurturing",
-                "Envoyer du contenu de valeur rgulirement",
+                "Ajouter à la campagne de nurturing",
+                "Envoyer du contenu de valeur régulièrement",
                 "Requalifier dans 30 jours"
             ])
         else:
             recommendations.extend([
-                "Enrichir les donnes du lead",
-                "Vrifier la validit des informations",
-                "Considrer l'archivage si pas de rponse"
+                "Enrichir les données du lead",
+                "Vérifier la validité des informations",
+                "Considérer l'archivage si pas de réponse"
             ])
         
-        # Recommandations spcifiques bases sur les donnes
+        # Recommandations spécifiques basées sur les données
         if not lead_data.get('phone'):
-            recommendations.append("Rechercher le numro de tlphone")
+            recommendations.append("Rechercher le numéro de téléphone")
         
         if not lead_data.get('company'):
             recommendations.append("Identifier l'entreprise du prospect")
@@ -350,7 +351,7 @@ class LeadQualificationService:
     
     def _suggest_next_actions(self, classification: str, lead_data: Dict) -> List[Dict[str, Any]]:
         """
-        Suggerer les prochaines actions concrtes
+        Suggerer les prochaines actions concrètes
         """
         actions = []
         
@@ -360,13 +361,13 @@ class LeadQualificationService:
                     "action": "CALL",
                     "priority": "HIGH",
                     "due_date": (datetime.now() + timedelta(hours=2)).isoformat(),
-                    "description": "Appel de dcouverte urgent"
+                    "description": "Appel de découverte urgent"
                 },
                 {
                     "action": "EMAIL",
                     "priority": "HIGH", 
                     "due_date": (datetime.now() + timedelta(hours=1)).isoformat(),
-                    "description": "Email de prise de contact personnalis"
+                    "description": "Email de prise de contact personnalisé"
                 }
             ])
         
@@ -376,13 +377,13 @@ class LeadQualificationService:
                     "action": "EMAIL_SEQUENCE",
                     "priority": "MEDIUM",
                     "due_date": (datetime.now() + timedelta(days=1)).isoformat(),
-                    "description": "Dmarrer squence email 5 tapes"
+                    "description": "Démarrer séquence email 5 étapes"
                 },
                 {
                     "action": "LINKEDIN_CONNECT",
                     "priority": "LOW",
                     "due_date": (datetime.now() + timedelta(days=2)).isoformat(),
-                    "description": "Connexion LinkedIn avec message personnalis"
+                    "description": "Connexion LinkedIn avec message personnalisé"
                 }
             ])
         
@@ -391,28 +392,41 @@ class LeadQualificationService:
                 "action": "NURTURE_CAMPAIGN",
                 "priority": "LOW",
                 "due_date": (datetime.now() + timedelta(days=7)).isoformat(),
-                "description": "Ajouter  la campagne de nurturing mensuelle"
+                "description": "Ajouter à la campagne de nurturing mensuelle"
             })
         
         return actions
     
     async def _update_lead_qualification(self, lead_id: int, score: float, classification: str):
         """
-        Mettre  jour les informations de qualification en base
+        Mettre à jour les informations de qualification en base
+        """
+        await self._update_leads_qualification([(lead_id, score, classification)])
+    
+    async def _update_leads_qualification(self, qualifications: List[tuple]):
+        """
+        Mettre à jour plusieurs leads (lead_id, score, classification) en une transaction
         """
+        if not qualifications:
+            return
+        
+        now = datetime.now()
         try:
             async with aiosqlite.connect("hunter_agency.db") as db:
-                await db.execute("""
+                await db.executemany("""
                     UPDATE pipeline_leads 
                     SET score = ?, status = ?, updated_at = ?
                     WHERE id = ?
-                """, (score, classification.lower(), datetime.now(), lead_id))
+                """, [
+                    (score, classification.lower(), now, lead_id)
+                    for lead_id, score, classification in qualifications
+                ])
                 await db.commit()
         except Exception as e:
-            print(f"Erreur mise  jour qualification: {e}")
+            print(f"Erreur mise à jour qualification: {e}")
     
     def _default_qualification_result(self, lead_id: int) -> Dict[str, Any]:
-        """Rsultat par dfaut en cas d'erreur"""
+        """Résultat par défaut en cas d'erreur"""
         return {
             'lead_id': lead_id,
             'qualification_score': 5.0,
@@ -429,13 +443,13 @@ class LeadQualificationService:
                 "action": "MANUAL_REVIEW",
                 "priority": "MEDIUM",
                 "due_date": (datetime.now() + timedelta(days=1)).isoformat(),
-                "description": "Qualification manuelle ncessaire"
+                "description": "Qualification manuelle nécessaire"
             }]
         }
     
     async def bulk_qualify_leads(self, limit: int = 50) -> List[Dict[str, Any]]:
         """
-        Qualification en lot des leads non qualifis
+        Qualification en lot des leads non qualifiés
         """
         results = []
         
@@ -449,16 +463,25 @@ class LeadQualificationService:
                 """, (limit,))
                 
                 lead_ids = [row[0] for row in await cursor.fetchall()]
-                
-                for lead_id in lead_ids:
-                    result = await self.qualify_lead(lead_id)
-                    results.append(result)
-                    
-                    # Pause entre chaque qualification
-                    await asyncio.sleep(0.1)
-                
-                print(f" {len(results)} leads qualifis avec succs")
-                return results
+            
+            # Qualifications en parallele, bornees pour ne pas saturer SQLite
+            semaphore = asyncio.Semaphore(BULK_QUALIFY_CONCURRENCY)
+            
+            async def qualify(lead_id: int) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self.qualify_lead(lead_id, persist=False)
+            
+            results = list(await asyncio.gather(*(qualify(lead_id) for lead_id in lead_ids)))
+            
+            # Une seule transaction pour toutes les mises à jour (hors résultats par défaut)
+            await self._update_leads_qualification([
+                (result['lead_id'], result['qualification_score'], result['classification'])
+                for result in results
+                if result['classification'] != 'UNKNOWN'
+            ])
+            
+            print(f" {len(results)} leads qualifiés avec succès")
+            return results
                 
         except Exception as e:
             print(f"L Erreur qualification en lot: {e}")
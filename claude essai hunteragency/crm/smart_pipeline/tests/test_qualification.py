@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+🧪 CRM SMART PIPELINE - Qualification Test Suite
+Bulk qualification against a real SQLite database
+"""
+
+import aiosqlite
+import pytest
+import pytest_asyncio
+
+from crm.smart_pipeline.services.qualification import LeadQualificationService
+
+# ============================================================================
+# 🏗️ TEST FIXTURES
+# ============================================================================
+
+@pytest_asyncio.fixture
+async def pipeline_db(tmp_path, monkeypatch):
+    """Create hunter_agency.db with three unqualified leads in a temp working dir"""
+    monkeypatch.chdir(tmp_path)
+    async with aiosqlite.connect("hunter_agency.db") as db:
+        await db.execute("""
+            CREATE TABLE pipeline_leads (
+                id INTEGER PRIMARY KEY,
+                email TEXT,
+                company TEXT,
+                source TEXT,
+                score REAL,
+                status TEXT DEFAULT 'new',
+                created_at TIMESTAMP,
+                updated_at TIMESTAMP
+            )
+        """)
+        await db.executemany(
+            "INSERT INTO pipeline_leads (id, email, company, source, created_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (1, "sophie@example.com", "SM Photography", "instagram", "2024-01-03"),
+                (2, "marc@example.com", "Studio Marc", "referral", "2024-01-02"),
+                (3, "broken@example.com", None, None, "2024-01-01"),
+            ]
+        )
+        await db.commit()
+    return tmp_path / "hunter_agency.db"
+
+# ============================================================================
+# 🎯 BULK QUALIFICATION TESTS
+# ============================================================================
+
+class TestBulkQualifyLeads:
+    """Test bulk_qualify_leads batching and persistence"""
+
+    @pytest.mark.asyncio
+    async def test_batched_write_skips_unknown(self, pipeline_db, monkeypatch):
+        """Test that results are written in one batch and UNKNOWN ones are left alone"""
+        service = LeadQualificationService()
+
+        # Lead 3 can't be loaded, so its qualification falls back to UNKNOWN
+        get_lead_data = service._get_lead_data
+
+        async def get_lead_data_failing_for_3(lead_id):
+            return None if lead_id == 3 else await get_lead_data(lead_id)
+
+        monkeypatch.setattr(service, "_get_lead_data", get_lead_data_failing_for_3)
+
+        batches = []
+        update_leads = service._update_leads_qualification
+
+        async def record_batch(qualifications):
+            batches.append(list(qualifications))
+            await update_leads(qualifications)
+
+        monkeypatch.setattr(service, "_update_leads_qualification", record_batch)
+
+        results = await service.bulk_qualify_leads()
+
+        by_id = {result['lead_id']: result for result in results}
+        assert set(by_id) == {1, 2, 3}
+        assert by_id[3]['classification'] == 'UNKNOWN'
+
+        assert len(batches) == 1
+        assert sorted(lead_id for lead_id, _, _ in batches[0]) == [1, 2]
+
+        async with aiosqlite.connect(pipeline_db) as db:
+            cursor = await db.execute("SELECT id, score, status FROM pipeline_leads ORDER BY id")
+            rows = {row[0]: row[1:] for row in await cursor.fetchall()}
+
+        for lead_id in (1, 2):
+            assert rows[lead_id] == (
+                by_id[lead_id]['qualification_score'],
+                by_id[lead_id]['classification'].lower()
+            )
+        assert rows[3] == (None, 'new')
+
+    @pytest.mark.asyncio
+    async def test_no_unqualified_leads(self, pipeline_db):
+        """Test that an already-qualified pipeline produces no results"""
+        async with aiosqlite.connect(pipeline_db) as db:
+            await db.execute("UPDATE pipeline_leads SET score = 7.5")
+            await db.commit()
+
+        assert await LeadQualificationService().bulk_qualify_leads() == []
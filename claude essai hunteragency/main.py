@@ -3,32 +3,21 @@ Hunter Agency V2.2 - Async Production Email Engine
 Transformed from V2.0 with full async architecture
 """
 
-# Fix pour éviter les métriques Prometheus dupliquées
-from prometheus_client import REGISTRY
-try:
-    collectors_to_remove = []
-    for collector in list(REGISTRY._collector_to_names.keys()):
-        collectors_to_remove.append(collector)
-    
-    for collector in collectors_to_remove:
-        try:
-            REGISTRY.unregister(collector)
-        except KeyError:
-            pass
-except:
-    pass
-
 import asyncio
 import os
+import random
+import sqlite3
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 import structlog
 import httpx
+import orjson
 from contextlib import asynccontextmanager
+from string import Template
 
 # FastAPI & Pydantic
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from fastapi.exception_handlers import request_validation_exception_handler
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel, EmailStr, ValidationError
@@ -37,13 +26,14 @@ from dotenv import load_dotenv
 # Database
 import aiosqlite
 from databases import Database
+from sqlalchemy import bindparam, text
 
 # Scheduling
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
 # Monitoring
-from prometheus_client import Counter, Histogram, Gauge
+from prometheus_client import REGISTRY, Counter, Histogram, Gauge
 
 load_dotenv()
 
@@ -68,33 +58,59 @@ logger = structlog.get_logger(__name__)
 # ========================
 
 DATABASE_URL = "sqlite+aiosqlite:///./hunter_agency.db"
-database = Database(DATABASE_URL)
+
+# Applied to every connection the databases pool opens (most PRAGMAs are per-connection)
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+)
+
+class TunedSQLiteConnection(sqlite3.Connection):
+    """sqlite3 connection that applies SQLITE_PRAGMAS as soon as it is opened"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for pragma in SQLITE_PRAGMAS:
+            self.execute(pragma)
+
+# databases forwards extra options to aiosqlite.connect -> sqlite3.connect(factory=...)
+database = Database(DATABASE_URL, factory=TunedSQLiteConnection)
 
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 SENDGRID_FROM_EMAIL = os.getenv('SENDGRID_FROM_EMAIL', 'contact@hunter-agency.com')
+SENDGRID_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=100, max_connections=200)
+SENDGRID_MAX_RETRIES = 3
+SENDGRID_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+SENDGRID_MAX_BACKOFF_SECONDS = 8
+SEQUENCE_SEND_CONCURRENCY = 20
+
+# The sequence scheduler does not claim rows before sending, so it must run in exactly one
+# process: disable it on scaled-out web workers and run a single instance with it enabled
+RUN_SEQUENCE_SCHEDULER = os.getenv("RUN_SEQUENCE_SCHEDULER", "true").lower() == "true"
 
 # ========================
 # METRICS (avec protection contre les doublons)
 # ========================
 
-try:
-    email_counter = Counter('emails_sent_total', 'Total emails sent', ['sequence_type', 'status'])
-    email_duration = Histogram('email_send_duration_seconds', 'Email send duration')
-    sequence_gauge = Gauge('active_sequences_total', 'Active sequences count')
-    lead_counter = Counter('leads_created_total', 'Total leads created', ['source', 'grade_tier'])
-except ValueError as e:
-    # Si les métriques existent déjà, les récupérer
-    logger.warning("Metrics already exist, reusing them", error=str(e))
-    for collector in REGISTRY._collector_to_names:
-        if hasattr(collector, '_name'):
-            if collector._name == 'emails_sent_total':
-                email_counter = collector
-            elif collector._name == 'email_send_duration_seconds':
-                email_duration = collector
-            elif collector._name == 'active_sequences_total':
-                sequence_gauge = collector
-            elif collector._name == 'leads_created_total':
-                lead_counter = collector
+def get_or_create_metric(metric_cls, name: str, documentation: str, labelnames=()):
+    """Si la métrique existe déjà (reload du module), la récupérer sans toucher aux autres collectors"""
+    existing = REGISTRY._names_to_collectors.get(name)
+    if existing is not None:
+        return existing
+    return metric_cls(name, documentation, labelnames)
+
+email_counter = get_or_create_metric(Counter, 'emails_sent_total', 'Total emails sent', ['sequence_type', 'status'])
+email_duration = get_or_create_metric(Histogram, 'email_send_duration_seconds', 'Email send duration')
+sequence_gauge = get_or_create_metric(Gauge, 'active_sequences_total', 'Active sequences count')
+lead_counter = get_or_create_metric(Counter, 'leads_created_total', 'Total leads created', ['source', 'grade_tier'])
+
+# Lead source comes from the request body: anything off this list is labelled "other"
+# so clients cannot blow up the label cardinality
+ALLOWED_LEAD_SOURCES = frozenset({"linkedin", "referral", "inbound", "webinar", "manual"})
 
 # ========================
 # DATABASE SETUP
@@ -103,11 +119,6 @@ except ValueError as e:
 async def create_tables():
     """Create database tables with async"""
     async with aiosqlite.connect("hunter_agency.db") as db:
-        # Enable optimizations
-        await db.execute("PRAGMA journal_mode=WAL")
-        await db.execute("PRAGMA synchronous=NORMAL")
-        await db.execute("PRAGMA cache_size=10000")
-        
         # Leads table
         await db.execute("""
             CREATE TABLE IF NOT EXISTS leads (
@@ -252,17 +263,115 @@ async def create_tables():
         await db.execute("CREATE INDEX IF NOT EXISTS idx_leads_email ON leads(email)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_campaigns_message_id ON email_campaigns(sendgrid_message_id)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_lead_sequences_next_send ON lead_sequences(next_send_at)")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_lead_sequences_active_next "
+            "ON lead_sequences(status, next_send_at) WHERE status = 'active'"
+        )
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_campaigns_lead_sent ON email_campaigns(lead_id, sent_at DESC)")
         
         # CRM indexes
         await db.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_leads_email ON pipeline_leads(email)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_leads_status ON pipeline_leads(status)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_leads_score ON pipeline_leads(score)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_opportunities_stage ON pipeline_opportunities(stage)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_leads_status_created ON pipeline_leads(status, created_at)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_leads_created ON pipeline_leads(created_at)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_opportunities_lead_id ON pipeline_opportunities(lead_id)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_activities_lead_id ON pipeline_activities(lead_id)")
         
+        # Refresh planner statistics so the composite/partial indexes get picked.
+        # PRAGMA optimize only analyzes tables that need it, and analysis_limit
+        # samples big tables instead of scanning them in full at every startup.
+        await db.execute("PRAGMA analysis_limit=400")
+        await db.execute("PRAGMA optimize")
+        
         await db.commit()
         logger.info("Database tables created successfully")
 
+# ========================
+# SQL STATEMENTS
+# ========================
+
+# Parsed once at import; handlers bind values with .bindparams() instead of re-parsing raw strings
+INSERT_LEAD_SQL = text("""
+    INSERT INTO leads (email, first_name, industry, source, grade)
+    VALUES (:email, :first_name, :industry, :source, :grade)
+    ON CONFLICT(email) DO NOTHING
+    RETURNING id
+""")
+SELECT_ACTIVE_SEQUENCE_SQL = text("""
+    SELECT id FROM email_sequences 
+    WHERE sequence_type = :type AND is_active = 1
+    LIMIT 1
+""")
+INSERT_LEAD_SEQUENCE_SQL = text("""
+    INSERT OR IGNORE INTO lead_sequences (lead_id, sequence_id, next_send_at)
+    VALUES (:lead_id, :sequence_id, :next_send)
+""")
+SELECT_PENDING_SEQUENCES_SQL = text("""
+    SELECT ls.id, ls.lead_id, ls.sequence_id, ls.current_step, l.email, l.first_name, l.industry,
+           es.sequence_type
+    FROM lead_sequences ls
+    JOIN leads l ON ls.lead_id = l.id
+    LEFT JOIN email_sequences es ON ls.sequence_id = es.id
+    WHERE ls.status = 'active' 
+    AND ls.next_send_at IS NOT NULL 
+    AND ls.next_send_at <= :now
+    LIMIT 50
+""")
+COUNT_SEQUENCES_BY_STATUS_SQL = text("SELECT COUNT(*) FROM lead_sequences WHERE status = :status")
+INSERT_CAMPAIGN_SQL = text("""
+    INSERT INTO email_campaigns (lead_id, template_type, subject, sendgrid_message_id, status, sequence_id, sequence_step)
+    VALUES (:lead_id, :template_type, :subject, :msg_id, :status, :sequence_id, :step)
+""")
+# Advances the step and, on the last step, completes the sequence in the same statement
+UPDATE_SEQ_PROGRESS_SQL = text("""
+    UPDATE lead_sequences 
+    SET current_step = :step,
+        next_send_at = CASE WHEN :step < :max_steps THEN :next_send ELSE NULL END,
+        status = CASE WHEN :step >= :max_steps THEN 'completed' ELSE status END,
+        completed_at = CASE WHEN :step >= :max_steps THEN :now ELSE completed_at END
+    WHERE id = :id
+""")
+EMAIL_STATS_30D_SQL = text("""
+    SELECT 
+        COUNT(*) as total_sent,
+        COUNT(CASE WHEN opened_at IS NOT NULL THEN 1 END) as total_opens,
+        COUNT(CASE WHEN clicked_at IS NOT NULL THEN 1 END) as total_clicks
+    FROM email_campaigns 
+    WHERE sent_at >= datetime('now', '-30 days')
+""")
+SELECT_CAMPAIGNS_BY_MESSAGES_SQL = text("""
+    SELECT id, sendgrid_message_id FROM email_campaigns 
+    WHERE sendgrid_message_id IN :msg_ids
+""").bindparams(bindparam("msg_ids", expanding=True))
+SELECT_LATEST_CAMPAIGN_BY_EMAIL_SQL = text("""
+    SELECT ec.id FROM email_campaigns ec
+    JOIN leads l ON ec.lead_id = l.id
+    WHERE l.email = :email
+    ORDER BY ec.sent_at DESC LIMIT 1
+""")
+MARK_CAMPAIGN_OPENED_SQL = text("""
+    UPDATE email_campaigns 
+    SET opened_at = :timestamp, status = 'opened'
+    WHERE id = :campaign_id AND opened_at IS NULL
+""")
+MARK_CAMPAIGN_CLICKED_SQL = text("""
+    UPDATE email_campaigns 
+    SET clicked_at = :timestamp, status = 'clicked'
+    WHERE id = :campaign_id AND clicked_at IS NULL
+""")
+MARK_CAMPAIGN_BOUNCED_SQL = text("""
+    UPDATE email_campaigns 
+    SET status = :status, bounce_reason = :reason
+    WHERE id = :campaign_id
+""")
+MARK_LEAD_INVALID_SQL = text("""
+    UPDATE leads 
+    SET status = 'invalid'
+    WHERE email = :email
+""")
+
 # ========================
 # MODELS
 # ========================
@@ -289,9 +398,20 @@ class AsyncSendGridClient:
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = "https://api.sendgrid.com/v3"
+        # One pooled client for every send: keep-alive connections skip the TCP+TLS handshake
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=30.0,
+            limits=SENDGRID_HTTP_LIMITS
+        )
+    
+    async def aclose(self):
+        """Close the pooled HTTP connections"""
+        await self.client.aclose()
         
     async def send_email(self, to_email: str, subject: str, html_content: str, 
-                        from_email: str = None) -> Dict:
+                        from_email: str = None, sequence_type: str = 'unknown') -> Dict:
         """Send email async with retry logic"""
         if not from_email:
             from_email = SENDGRID_FROM_EMAIL
@@ -308,47 +428,62 @@ class AsyncSendGridClient:
             }]
         }
         
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            for attempt in range(3):
-                try:
-                    with email_duration.time():
-                        response = await client.post(
-                            f"{self.base_url}/mail/send",
-                            json=payload,
-                            headers=headers
-                        )
-                    
-                    if response.status_code == 202:
-                        message_id = response.headers.get('X-Message-Id')
-                        logger.info("Email sent successfully", 
-                                  to_email=to_email, message_id=message_id)
-                        email_counter.labels(sequence_type='unknown', status='sent').inc()
-                        return {"status": "sent", "message_id": message_id}
-                    
-                    elif response.status_code == 429:
-                        wait_time = 2 ** attempt
-                        logger.warning("Rate limited, retrying", 
-                                     attempt=attempt, wait_time=wait_time)
-                        await asyncio.sleep(wait_time)
-                        continue
-                    
-                    else:
-                        logger.error("SendGrid error", 
-                                   status_code=response.status_code,
-                                   response=response.text)
-                        email_counter.labels(sequence_type='unknown', status='failed').inc()
-                        return {"status": "failed", "error": response.text}
-                        
-                except Exception as e:
-                    logger.error("Email send exception", error=str(e), attempt=attempt)
-                    if attempt == 2:
-                        email_counter.labels(sequence_type='unknown', status='error').inc()
-                        return {"status": "error", "error": str(e)}
-                    await asyncio.sleep(2 ** attempt)
+        for attempt in range(SENDGRID_MAX_RETRIES):
+            try:
+                with email_duration.time():
+                    response = await self.client.post("/mail/send", json=payload)
+            except httpx.TransportError as e:
+                logger.error("Email send exception", error=str(e), attempt=attempt)
+                if attempt == SENDGRID_MAX_RETRIES - 1:
+                    email_counter.labels(sequence_type=sequence_type, status='error').inc()
+                    return {"status": "error", "error": str(e)}
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            except Exception as e:
+                logger.error("Email send exception", error=str(e), attempt=attempt)
+                email_counter.labels(sequence_type=sequence_type, status='error').inc()
+                return {"status": "error", "error": str(e)}
+            
+            if response.status_code == 202:
+                message_id = response.headers.get('X-Message-Id')
+                logger.info("Email sent successfully", 
+                          to_email=to_email, message_id=message_id)
+                email_counter.labels(sequence_type=sequence_type, status='sent').inc()
+                return {"status": "sent", "message_id": message_id}
+            
+            elif response.status_code in SENDGRID_RETRY_STATUSES:
+                if attempt == SENDGRID_MAX_RETRIES - 1:
+                    break  # Out of retries: give up now rather than sleeping first
+                wait_time = self._backoff(attempt, response.headers.get('Retry-After'))
+                logger.warning("SendGrid unavailable, retrying", 
+                             status_code=response.status_code, attempt=attempt, wait_time=wait_time)
+                await asyncio.sleep(wait_time)
+                continue
+            
+            else:
+                # Permanent failure (bad payload, auth...): retrying would not help
+                logger.error("SendGrid error", 
+                           status_code=response.status_code,
+                           response=response.text)
+                email_counter.labels(sequence_type=sequence_type, status='failed').inc()
+                return {"status": "failed", "error": response.text}
         
+        logger.error("SendGrid retries exhausted", status_code=response.status_code)
+        email_counter.labels(sequence_type=sequence_type, status='failed').inc()
         return {"status": "failed", "error": "Max retries exceeded"}
+    
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full-jitter backoff, honoring SendGrid's Retry-After when given"""
+        if retry_after:
+            try:
+                return min(float(retry_after), SENDGRID_MAX_BACKOFF_SECONDS)
+            except ValueError:
+                pass
+        return random.uniform(0, min(2 ** attempt, SENDGRID_MAX_BACKOFF_SECONDS))
+
+# Built in lifespan startup and closed on shutdown, so each app run gets a fresh pool
+sendgrid_client: Optional[AsyncSendGridClient] = None
 
 # ========================
 # BUSINESS LOGIC
@@ -388,27 +523,26 @@ async def create_lead_async(lead_data: Lead) -> Dict:
     
     try:
         # Use database connection pool
-        lead_id = await database.fetch_val("""
-            INSERT INTO leads (email, first_name, industry, source, grade)
-            VALUES (:email, :first_name, :industry, :source, :grade)
-            RETURNING id
-        """, {
-            "email": lead_data.email,
-            "first_name": lead_data.first_name,
-            "industry": lead_data.industry,
-            "source": lead_data.source,
-            "grade": grade
-        })
-        
-        lead_counter.labels(source=lead_data.source, grade_tier=grade_tier).inc()
-        logger.info("Lead created", lead_id=lead_id, email=lead_data.email, grade=grade)
-        
-        return {"lead_id": lead_id, "grade": grade, "grade_tier": grade_tier}
-        
+        lead_id = await database.fetch_val(INSERT_LEAD_SQL.bindparams(
+            email=lead_data.email,
+            first_name=lead_data.first_name,
+            industry=lead_data.industry,
+            source=lead_data.source,
+            grade=grade
+        ))
     except Exception as e:
-        if "UNIQUE constraint failed" in str(e):
-            raise HTTPException(status_code=400, detail="Lead already exists")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    
+    # ON CONFLICT DO NOTHING returns no row when the email is already known
+    if lead_id is None:
+        raise HTTPException(status_code=400, detail="Lead already exists")
+    
+    source = (lead_data.source or "").lower()
+    metric_source = source if source in ALLOWED_LEAD_SOURCES else "other"
+    lead_counter.labels(source=metric_source, grade_tier=grade_tier).inc()
+    logger.info("Lead created", lead_id=lead_id, email=lead_data.email, grade=grade)
+    
+    return {"lead_id": lead_id, "grade": grade, "grade_tier": grade_tier}
 
 def get_email_template(template_name: str, lead_data: dict, loom_id: str = None):
     """Get email template using advanced template engine"""
@@ -422,49 +556,51 @@ def get_email_template(template_name: str, lead_data: dict, loom_id: str = None)
         logger.warning("Could not import advanced email templates, using fallback")
         return get_simple_email_template(template_name, lead_data)
 
-def get_simple_email_template(template_name: str, lead_data: dict):
-    """Fallback simple email template (legacy)"""
-    first_name = lead_data.get('first_name', 'there')
-    industry = lead_data.get('industry', 'business')
-    
-    templates = {
-        "cold_outreach_step1": f"""
-        <html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; text-align: center;">
-                <h1 style="color: white;">🔥 Hunter Agency V2.2</h1>
-            </div>
-            <div style="padding: 30px;">
-                <p>Hey <strong>{first_name}</strong>! 👋</p>
-                <p>I noticed you're in {industry} and wanted to reach out.</p>
-                <p>I help {industry} businesses scale their lead generation with automation.</p>
-                <p><strong>Quick question:</strong> What's your biggest challenge with lead generation right now?</p>
-                <div style="text-align: center; margin: 25px 0;">
-                    <a href="https://calendly.com/hunter-agency" style="background: #667eea; color: white; padding: 15px 30px; text-decoration: none; border-radius: 8px; display: inline-block;">📅 Quick Chat</a>
-                </div>
-                <p>Best,<br>Hunter Agency V2.2 Team</p>
-            </div>
-        </body></html>""",
-        
-        "nurturing_step1": f"""
-        <html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; text-align: center;">
-                <h1 style="color: white;">🎉 Welcome {first_name}!</h1>
-            </div>
-            <div style="padding: 30px;">
-                <p>Thanks for your interest in {industry} automation!</p>
-                <p>Here's what happens next:</p>
-                <ol>
-                    <li>We'll analyze your current setup</li>
-                    <li>Create a custom strategy</li>
-                    <li>Implement and optimize</li>
-                </ol>
-                <p>I'll send you a detailed plan in the next 48 hours.</p>
-                <p>Best,<br>Hunter Agency V2.2 Team</p>
+# Fallback templates parsed once at import; only the lead fields are substituted per send
+SIMPLE_EMAIL_TEMPLATES = {
+    "cold_outreach_step1": Template("""
+    <html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; text-align: center;">
+            <h1 style="color: white;">🔥 Hunter Agency V2.2</h1>
+        </div>
+        <div style="padding: 30px;">
+            <p>Hey <strong>$first_name</strong>! 👋</p>
+            <p>I noticed you're in $industry and wanted to reach out.</p>
+            <p>I help $industry businesses scale their lead generation with automation.</p>
+            <p><strong>Quick question:</strong> What's your biggest challenge with lead generation right now?</p>
+            <div style="text-align: center; margin: 25px 0;">
+                <a href="https://calendly.com/hunter-agency" style="background: #667eea; color: white; padding: 15px 30px; text-decoration: none; border-radius: 8px; display: inline-block;">📅 Quick Chat</a>
             </div>
-        </body></html>"""
-    }
+            <p>Best,<br>Hunter Agency V2.2 Team</p>
+        </div>
+    </body></html>"""),
     
-    return templates.get(template_name, templates["cold_outreach_step1"])
+    "nurturing_step1": Template("""
+    <html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; text-align: center;">
+            <h1 style="color: white;">🎉 Welcome $first_name!</h1>
+        </div>
+        <div style="padding: 30px;">
+            <p>Thanks for your interest in $industry automation!</p>
+            <p>Here's what happens next:</p>
+            <ol>
+                <li>We'll analyze your current setup</li>
+                <li>Create a custom strategy</li>
+                <li>Implement and optimize</li>
+            </ol>
+            <p>I'll send you a detailed plan in the next 48 hours.</p>
+            <p>Best,<br>Hunter Agency V2.2 Team</p>
+        </div>
+    </body></html>""")
+}
+
+def get_simple_email_template(template_name: str, lead_data: dict):
+    """Fallback simple email template (legacy)"""
+    template = SIMPLE_EMAIL_TEMPLATES.get(template_name, SIMPLE_EMAIL_TEMPLATES["cold_outreach_step1"])
+    return template.substitute(
+        first_name=lead_data.get('first_name', 'there'),
+        industry=lead_data.get('industry', 'business')
+    )
 
 # ========================
 # SEQUENCE PROCESSOR
@@ -498,31 +634,27 @@ class AsyncSequenceProcessor:
             now = datetime.now()
             
             # Get pending sequences with async query
-            pending = await database.fetch_all("""
-                SELECT ls.id, ls.lead_id, ls.sequence_id, ls.current_step, l.email, l.first_name, l.industry
-                FROM lead_sequences ls
-                JOIN leads l ON ls.lead_id = l.id
-                WHERE ls.status = 'active' 
-                AND ls.next_send_at IS NOT NULL 
-                AND ls.next_send_at <= :now
-                LIMIT 50
-            """, {"now": now})
+            pending = await database.fetch_all(SELECT_PENDING_SEQUENCES_SQL.bindparams(now=now))
             
             if pending:
                 logger.info("Processing pending sequences", count=len(pending))
                 
-                # Process sequences async
-                for sequence_data in pending:
-                    try:
-                        await self.send_sequence_email(sequence_data)
-                        await asyncio.sleep(1)  # Rate limiting
-                    except Exception as e:
-                        logger.error("Error processing sequence", 
-                                   sequence_id=sequence_data['id'], error=str(e))
+                # Process sequences concurrently; SendGrid 429s are handled by the client backoff
+                semaphore = asyncio.Semaphore(SEQUENCE_SEND_CONCURRENCY)
+                
+                async def process(sequence_data):
+                    async with semaphore:
+                        try:
+                            await self.send_sequence_email(sequence_data)
+                        except Exception as e:
+                            logger.error("Error processing sequence", 
+                                       sequence_id=sequence_data['id'], error=str(e))
+                
+                await asyncio.gather(*(process(sequence_data) for sequence_data in pending))
             
             # Update metrics
             active_count = await database.fetch_val(
-                "SELECT COUNT(*) FROM lead_sequences WHERE status = 'active'"
+                COUNT_SEQUENCES_BY_STATUS_SQL.bindparams(status='active')
             )
             sequence_gauge.set(active_count or 0)
             
@@ -551,52 +683,40 @@ class AsyncSequenceProcessor:
         html_content = get_email_template(template_name, lead_data)
         
         # Send email
-        if SENDGRID_API_KEY:
-            client = AsyncSendGridClient(SENDGRID_API_KEY)
-            result = await client.send_email(
+        if sendgrid_client:
+            result = await sendgrid_client.send_email(
                 to_email=email,
                 subject=subject,
-                html_content=html_content
+                html_content=html_content,
+                sequence_type=sequence_data['sequence_type'] or 'unknown'
             )
         else:
             result = {"status": "sent", "message_id": f"test_{datetime.now().timestamp()}"}
             logger.info("Email sent (test mode - no SendGrid API key)", to_email=email)
         
         # Log result
-        await database.execute("""
-            INSERT INTO email_campaigns (lead_id, template_type, subject, sendgrid_message_id, status, sequence_id, sequence_step)
-            VALUES (:lead_id, :template_type, :subject, :msg_id, :status, :sequence_id, :step)
-        """, {
-            "lead_id": lead_id,
-            "template_type": template_name,
-            "subject": subject,
-            "msg_id": result.get('message_id'),
-            "status": result['status'],
-            "sequence_id": sequence_data['sequence_id'],
-            "step": next_step
-        })
+        await database.execute(INSERT_CAMPAIGN_SQL.bindparams(
+            lead_id=lead_id,
+            template_type=template_name,
+            subject=subject,
+            msg_id=result.get('message_id'),
+            status=result['status'],
+            sequence_id=sequence_data['sequence_id'],
+            step=next_step
+        ))
         
         # Update sequence progress
         if result['status'] == 'sent':
             # Calculate next send time (3 days later for next step)
-            next_send = datetime.now() + timedelta(days=3)
-            
-            await database.execute("""
-                UPDATE lead_sequences 
-                SET current_step = :step, next_send_at = :next_send
-                WHERE id = :id
-            """, {
-                "id": sequence_data['id'],
-                "step": next_step,
-                "next_send": next_send if next_step < 5 else None  # Stop after 5 steps
-            })
+            now = datetime.now()
             
-            if next_step >= 5:
-                await database.execute("""
-                    UPDATE lead_sequences 
-                    SET status = 'completed', completed_at = :now
-                    WHERE id = :id
-                """, {"id": sequence_data['id'], "now": datetime.now()})
+            await database.execute(UPDATE_SEQ_PROGRESS_SQL.bindparams(
+                id=sequence_data['id'],
+                step=next_step,
+                max_steps=5,  # Stop after 5 steps
+                next_send=now + timedelta(days=3),
+                now=now
+            ))
 
 # ========================
 # SEQUENCE TEMPLATES SETUP
@@ -636,19 +756,32 @@ sequence_processor = AsyncSequenceProcessor()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global sendgrid_client
+    
     # Startup
     logger.info("Starting Hunter Agency V2.2 Async...")
+    if SENDGRID_API_KEY:
+        sendgrid_client = AsyncSendGridClient(SENDGRID_API_KEY)
     await database.connect()
     await create_tables()
+    if migrate_auth_schema is not None:
+        await migrate_auth_schema()
     await create_default_sequences()
-    await sequence_processor.start()
+    if RUN_SEQUENCE_SCHEDULER:
+        await sequence_processor.start()
     logger.info("Application started successfully")
     
     yield
     
     # Shutdown
     logger.info("Shutting down...")
-    await sequence_processor.stop()
+    if sequence_processor.scheduler.running:
+        await sequence_processor.stop()
+    if sendgrid_client:
+        await sendgrid_client.aclose()
+        sendgrid_client = None
+    if pipeline_engine is not None:
+        await pipeline_engine.dispose()
     await database.disconnect()
     logger.info("Application shutdown complete")
 
@@ -660,7 +793,8 @@ app = FastAPI(
     title="Hunter Agency V2.2 - Async Email Engine",
     description="Production-ready async email sequences",
     version="2.2.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # ========================
@@ -710,17 +844,24 @@ async def general_exception_handler(request: Request, exc: Exception):
 
 # Import CRM routes
 try:
-    from crm.smart_pipeline.api.routes import router as pipeline_router
+    from crm.smart_pipeline.api.routes import router as pipeline_router, engine as pipeline_engine
     app.include_router(pipeline_router, prefix="/api")
     logger.info("CRM routes imported successfully")
 except ImportError as e:
+    pipeline_engine = None
     logger.warning("Could not import CRM routes", error=str(e))
 
+try:
+    from crm.auth import migrate_schema as migrate_auth_schema
+except ImportError as e:
+    migrate_auth_schema = None
+    logger.warning("Could not import CRM auth", error=str(e))
+
 # ========================
 # API ENDPOINTS
 # ========================
 
-@app.get("/health")
+@app.get("/health", include_in_schema=False)
 async def health_check():
     """Async health check"""
     try:
@@ -746,22 +887,15 @@ async def create_lead_endpoint(lead: Lead):
     sequence_type = "nurturing" if result["grade"] >= 70 else "cold_outreach"
     
     # Get sequence ID
-    sequence = await database.fetch_one("""
-        SELECT id FROM email_sequences 
-        WHERE sequence_type = :type AND is_active = 1
-        LIMIT 1
-    """, {"type": sequence_type})
+    sequence = await database.fetch_one(SELECT_ACTIVE_SEQUENCE_SQL.bindparams(type=sequence_type))
     
     if sequence:
         # Add to sequence
-        await database.execute("""
-            INSERT OR IGNORE INTO lead_sequences (lead_id, sequence_id, next_send_at)
-            VALUES (:lead_id, :sequence_id, :next_send)
-        """, {
-            "lead_id": result["lead_id"],
-            "sequence_id": sequence["id"],
-            "next_send": datetime.now()  # Send first email immediately
-        })
+        await database.execute(INSERT_LEAD_SEQUENCE_SQL.bindparams(
+            lead_id=result["lead_id"],
+            sequence_id=sequence["id"],
+            next_send=datetime.now()  # Send first email immediately
+        ))
     
     return {
         "message": "Lead created and sequence triggered",
@@ -774,23 +908,16 @@ async def get_sequence_analytics():
     """Get async sequence analytics"""
     # Active sequences
     active_sequences = await database.fetch_val(
-        "SELECT COUNT(*) FROM lead_sequences WHERE status = 'active'"
+        COUNT_SEQUENCES_BY_STATUS_SQL.bindparams(status='active')
     ) or 0
     
     # Completed sequences
     completed_sequences = await database.fetch_val(
-        "SELECT COUNT(*) FROM lead_sequences WHERE status = 'completed'"
+        COUNT_SEQUENCES_BY_STATUS_SQL.bindparams(status='completed')
     ) or 0
     
     # Email performance
-    email_stats = await database.fetch_one("""
-        SELECT 
-            COUNT(*) as total_sent,
-            COUNT(CASE WHEN opened_at IS NOT NULL THEN 1 END) as total_opens,
-            COUNT(CASE WHEN clicked_at IS NOT NULL THEN 1 END) as total_clicks
-        FROM email_campaigns 
-        WHERE sent_at >= datetime('now', '-30 days')
-    """)
+    email_stats = await database.fetch_one(EMAIL_STATS_30D_SQL)
     
     total_sent = email_stats["total_sent"] if email_stats else 0
     total_opens = email_stats["total_opens"] if email_stats else 0
@@ -812,94 +939,106 @@ async def get_sequence_analytics():
 @app.post("/webhooks/sendgrid")
 async def handle_sendgrid_webhook(events: List[WebhookEvent]):
     """Handle SendGrid webhook events async"""
+    # SendGrid re-delivers identical events on retries; only the first one changes anything
+    # (opened_at/clicked_at are only set once, bounces are idempotent)
+    seen = set()
+    unique_events = []
     for event in events:
-        try:
-            # Find campaign by message ID or email
-            if event.sg_message_id:
-                campaign = await database.fetch_one("""
-                    SELECT id FROM email_campaigns 
-                    WHERE sendgrid_message_id = :msg_id
-                """, {"msg_id": event.sg_message_id})
-            else:
-                # Fallback: find by email (most recent)
-                campaign = await database.fetch_one("""
-                    SELECT ec.id FROM email_campaigns ec
-                    JOIN leads l ON ec.lead_id = l.id
-                    WHERE l.email = :email
-                    ORDER BY ec.sent_at DESC LIMIT 1
-                """, {"email": event.email})
-            
-            if not campaign:
-                continue
-            
-            # Update campaign based on event type
-            if event.event == "open":
-                await database.execute("""
-                    UPDATE email_campaigns 
-                    SET opened_at = :timestamp, status = 'opened'
-                    WHERE id = :campaign_id AND opened_at IS NULL
-                """, {
-                    "timestamp": datetime.fromtimestamp(event.timestamp),
-                    "campaign_id": campaign["id"]
-                })
+        key = (event.sg_message_id, event.email, event.event)
+        if key not in seen:
+            seen.add(key)
+            unique_events.append(event)
+    
+    # Resolve every message ID of the batch with a single IN (...) lookup
+    message_ids = list({event.sg_message_id for event in unique_events if event.sg_message_id})
+    campaign_ids = {}
+    if message_ids:
+        rows = await database.fetch_all(SELECT_CAMPAIGNS_BY_MESSAGES_SQL.bindparams(msg_ids=message_ids))
+        campaign_ids = {row["sendgrid_message_id"]: row["id"] for row in rows}
+    
+    # One transaction for the whole batch: a single WAL commit instead of one per update
+    async with database.transaction():
+        for event in unique_events:
+            try:
+                # Find campaign by message ID or email
+                if event.sg_message_id:
+                    campaign_id = campaign_ids.get(event.sg_message_id)
+                else:
+                    # Fallback: find by email (most recent)
+                    campaign = await database.fetch_one(
+                        SELECT_LATEST_CAMPAIGN_BY_EMAIL_SQL.bindparams(email=event.email)
+                    )
+                    campaign_id = campaign["id"] if campaign else None
                 
-            elif event.event == "click":
-                await database.execute("""
-                    UPDATE email_campaigns 
-                    SET clicked_at = :timestamp, status = 'clicked'
-                    WHERE id = :campaign_id AND clicked_at IS NULL
-                """, {
-                    "timestamp": datetime.fromtimestamp(event.timestamp),
-                    "campaign_id": campaign["id"]
-                })
+                if not campaign_id:
+                    continue
                 
-            elif event.event in ["bounce", "blocked", "dropped"]:
-                await database.execute("""
-                    UPDATE email_campaigns 
-                    SET status = :status, bounce_reason = :reason
-                    WHERE id = :campaign_id
-                """, {
-                    "status": event.event,
-                    "reason": f"SendGrid {event.event} event",
-                    "campaign_id": campaign["id"]
-                })
+                # Update campaign based on event type
+                if event.event == "open":
+                    await database.execute(MARK_CAMPAIGN_OPENED_SQL.bindparams(
+                        timestamp=datetime.fromtimestamp(event.timestamp),
+                        campaign_id=campaign_id
+                    ))
                 
-                # Mark lead as invalid
-                await database.execute("""
-                    UPDATE leads 
-                    SET status = 'invalid'
-                    WHERE email = :email
-                """, {"email": event.email})
+                elif event.event == "click":
+                    await database.execute(MARK_CAMPAIGN_CLICKED_SQL.bindparams(
+                        timestamp=datetime.fromtimestamp(event.timestamp),
+                        campaign_id=campaign_id
+                    ))
                 
-            logger.info("Webhook processed", event=event.event, email=event.email)
-        
-        except Exception as e:
-            logger.error("Webhook processing error", event=event.dict(), error=str(e))
+                elif event.event in ["bounce", "blocked", "dropped"]:
+                    await database.execute(MARK_CAMPAIGN_BOUNCED_SQL.bindparams(
+                        status=event.event,
+                        reason=f"SendGrid {event.event} event",
+                        campaign_id=campaign_id
+                    ))
+                    
+                    # Mark lead as invalid
+                    await database.execute(MARK_LEAD_INVALID_SQL.bindparams(email=event.email))
+                
+                logger.info("Webhook processed", event=event.event, email=event.email)
+            
+            except Exception as e:
+                logger.error("Webhook processing error", event=event.dict(), error=str(e))
     
     return {"status": "processed", "events": len(events)}
 
-@app.get("/")
+# Static payload, serialized once at import
+ROOT_RESPONSE_BODY = orjson.dumps({
+    "message": "Hunter Agency V2.2 - Async Email Engine",
+    "version": "2.2.0",
+    "status": "running",
+    "endpoints": {
+        "health": "/health",
+        "create_lead": "/leads",
+        "analytics": "/sequences/analytics",
+        "webhook": "/webhooks/sendgrid"
+    }
+})
+
+@app.get("/", include_in_schema=False)
 async def root():
     """Root endpoint"""
-    return {
-        "message": "Hunter Agency V2.2 - Async Email Engine",
-        "version": "2.2.0",
-        "status": "running",
-        "endpoints": {
-            "health": "/health",
-            "create_lead": "/leads",
-            "analytics": "/sequences/analytics",
-            "webhook": "/webhooks/sendgrid"
-        }
-    }
+    return Response(content=ROOT_RESPONSE_BODY, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
+    # uvloop + httptools ship with uvicorn[standard]; reload and workers are mutually exclusive
+    reload = os.getenv("RELOAD", "false").lower() == "true"
+    workers = 1 if reload else int(os.getenv("WORKERS", "1"))
+    if workers > 1 and RUN_SEQUENCE_SCHEDULER:
+        # Each worker runs lifespan, so each would send every due sequence email
+        logger.warning("Sequence scheduler enabled, starting a single worker "
+                       "(set RUN_SEQUENCE_SCHEDULER=false to scale out)", workers=workers)
+        workers = 1
     uvicorn.run(
         "main:app",
-        host="0.0.0.0",
-        port=8001,
-        reload=True,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8001")),
+        loop="uvloop",
+        http="httptools",
+        reload=reload,
+        workers=workers,
         log_level="info"
     )
     